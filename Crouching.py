@@ -1,24 +1,19 @@
-import pigpio
 import time
 import json
 
-# Initialize pigpio
-pi = pigpio.pi()
+from calibration import load_calibration
+from hal import open_servo_bus
 
-# Check if pigpio is connected
-if not pi.connected:
-    print("Failed to connect to pigpio daemon")
+# Open the servo backend
+try:
+    servos = open_servo_bus()  # pigpio unless --backend or ROBOT_BACKEND picks pca9685 or sim
+except ConnectionError as e:
+    print(e)
     exit()
 
-# Pin assignments for servos
-servo_pins = {
-    "Hip Left": 23,
-    "Knee Left": 22,
-    "Hip Right": 27,
-    "Knee Right": 17,
-    "Left Toe": 16,
-    "Right Toe": 26,
-}
+# Pin assignments for servos, and angle -> pulsewidth per joint (calibration.py)
+servo_pins = servos.servo_pins
+calibration = load_calibration()
 
 # Natural standing position (initial values, can be adjusted)
 natural_standing_position = {
@@ -30,28 +25,13 @@ natural_standing_position = {
     "Right Toe": 110
 }
 
-# Function to set servo position
-def set_servo_angle(pin, angle, reverse=False):
-    """
-    Sets the servo to a specific angle.
-    If reverse is True, the angle is flipped (180 - angle).
-    """
-    if reverse:
-        angle = 180 - angle
-
-    # Convert angle to pulsewidth and ensure it is within the valid range (500 to 2500)
-    pulsewidth = 500 + (angle / 180.0) * 2000
-    pulsewidth = max(500, min(2500, pulsewidth))  # Ensure pulsewidth stays within range
-    pi.set_servo_pulsewidth(pin, pulsewidth)
-
 # Move all servos simultaneously by setting them all in one go
 def move_all_servos(angles):
     """
     Moves all servos to their respective target angles at the same time.
     """
+    servos.commit_frame(calibration.frame(angles, servo_pins))  # one round trip per pose, only when it changed
     for joint, angle in angles.items():
-        reverse = joint in ["Right Toe"]  # Reverse for oppositely oriented servos
-        set_servo_angle(servo_pins[joint], angle, reverse)
         print(f"{joint} moved to {angle}°")
 
 # Crouching Motion Simulation with 2-second delays
@@ -99,7 +79,5 @@ except KeyboardInterrupt:
     print("\nProgram interrupted by user.")
 finally:
     # Cleanup: Turn off all servos
-    for pin in servo_pins.values():
-        pi.set_servo_pulsewidth(pin, 0)
-    pi.stop()
-    print("pigpio cleanup complete.")
+    servos.close()
+    print("Servo cleanup complete.")
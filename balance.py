@@ -0,0 +1,200 @@
+import threading
+import time
+
+from fusion import MAX_DT, ComplementaryFilter
+from hal import LatencyStats
+from scheduler import RateScheduler
+
+# ==========================
+# Balance Controller
+# ==========================
+# Closed-loop attitude hold: every 5 ms read the IMU, fuse pitch and roll,
+# and add PID corrections to the pose the motion code asked for before it
+# goes out to the servos. Whatever sets the pose (a gait, a pattern, a GUI
+# slider) calls set_pose(); the controller owns the servo output.
+#
+# Corrections are in degrees of body tilt and spread over the joints by the
+# mixes below (servo degrees per degree of correction). With both feet on
+# the floor the body pitch follows the mean foot angle, so opening the hips
+# and pointing the toes by half a degree each raises the pitch by one
+# degree; rolling comes from tipping the feet in opposite directions, which
+# lifts one side on its toe tip and the other on its heel.
+
+CONTROL_RATE = 200   # Hz
+MAX_CORRECTION = 15  # degrees, per axis
+
+# (kp, ki, kd); the derivative acts on the gyro rate, not the error
+PITCH_GAINS = (1.0, 8.0, 0.01)
+ROLL_GAINS = (1.0, 8.0, 0.01)
+
+PITCH_MIX = {"Hip Left": 0.5, "Hip Right": 0.5, "Left Toe": -0.5, "Right Toe": -0.5}
+ROLL_MIX = {"Left Toe": -1.0, "Right Toe": 1.0}
+
+
+def clamp(value, limit):
+    return max(-limit, min(limit, value))
+
+
+class PID:
+    """
+    PID loop with anti-windup: the integral stops growing while the output
+    is saturated in the direction of the error, and never exceeds the limit
+    on its own.
+    """
+
+    def __init__(self, kp, ki=0.0, kd=0.0, limit=MAX_CORRECTION):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.limit = limit
+        self.integral = 0.0
+        self.last_error = None
+        self.output = 0.0
+
+    def reset(self):
+        self.integral = 0.0
+        self.last_error = None
+        self.output = 0.0
+
+    def update(self, error, dt, rate=None):
+        """
+        New output for 'error' after 'dt' seconds. 'rate' is the measured rate
+        of change of the controlled value; without it the error is differenced.
+        """
+        if rate is not None:
+            derivative = -rate
+        elif self.last_error is not None and dt > 0:
+            derivative = (error - self.last_error) / dt
+        else:
+            derivative = 0.0
+        self.last_error = error
+
+        proportional = self.kp * error + self.kd * derivative
+        integral = self.integral + self.ki * error * dt
+        unsaturated = proportional + integral
+        if abs(unsaturated) <= self.limit or (unsaturated > 0) != (error > 0):
+            self.integral = clamp(integral, self.limit)
+        self.output = clamp(proportional + self.integral, self.limit)
+        return self.output
+
+
+class BalanceController:
+    """
+    Hold the body level around 'pose' (joint -> servo degrees).
+
+    'output' receives the corrected joint -> angle dict every step, e.g. a
+    move_all_servos() that commits one frame without sleeping:
+
+        controller = BalanceController(imu, send_pose, base_position)
+        controller.start()            # 200 Hz on its own thread
+        controller.set_pose(step)     # from the motion code, any time
+        controller.stop()
+
+    'latency' records the time from reading a sample to handing the
+    corrected pose to 'output'. A stability_monitor.StabilityMonitor passed
+    as 'monitor' is fed every sample.
+
+    To run it on a runtime.ControlRuntime instead, pass correct() as the
+    control function; it does everything step() does except the I/O.
+    """
+
+    def __init__(self, imu, output, pose, rate=CONTROL_RATE, pitch_gains=PITCH_GAINS, roll_gains=ROLL_GAINS,
+                 pitch_mix=PITCH_MIX, roll_mix=ROLL_MIX, alpha=0.98, monitor=None):
+        self.imu = imu
+        self.output = output
+        self.monitor = monitor
+        self.rate = rate
+        self.pitch_pid = PID(*pitch_gains)
+        self.roll_pid = PID(*roll_gains)
+        self.pitch_mix = dict(pitch_mix)
+        self.roll_mix = dict(roll_mix)
+        self.filter = ComplementaryFilter(alpha)
+        self.pose = dict(pose)
+        self.pitch_target = 0.0
+        self.roll_target = 0.0
+        self.pitch = None
+        self.roll = None
+        self.correction = (0.0, 0.0)
+        self.latency = LatencyStats()
+        self.scheduler = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._last_timestamp = None
+
+    def set_pose(self, pose):
+        """Pose to balance around from the next step on."""
+        self.pose = dict(pose)
+
+    def reset(self):
+        self.pitch_pid.reset()
+        self.roll_pid.reset()
+        self.correction = (0.0, 0.0)
+        self._last_timestamp = None
+
+    def step(self):
+        """Read one sample and send one corrected pose. Returns the pose sent."""
+        sample = self.imu.read_sample()
+        start = time.perf_counter()
+        angles = self._correct(sample)
+        self.output(angles)
+        self.latency.add(time.perf_counter() - start)
+        if self.monitor is not None:
+            self.monitor.update(sample, self.pitch, self.roll)
+        return angles
+
+    def correct(self, sample):
+        """Corrected pose for one sample, without sending it."""
+        angles = self._correct(sample)
+        if self.monitor is not None:
+            self.monitor.update(sample, self.pitch, self.roll)
+        return angles
+
+    def _correct(self, sample):
+        if sample.timestamp == self._last_timestamp:
+            # The same reading again (read faster than the IMU samples): keep the last correction
+            return self._mix(*self.correction)
+        self.pitch, self.roll = self.filter.update(sample)
+
+        dt = 1.0 / self.rate
+        if self._last_timestamp is not None and 0 < sample.timestamp - self._last_timestamp <= MAX_DT:
+            dt = sample.timestamp - self._last_timestamp
+        self._last_timestamp = sample.timestamp
+
+        # Same axes as fusion.ComplementaryFilter: pitch rate is -gy, roll rate is gx
+        pitch_correction = self.pitch_pid.update(self.pitch_target - self.pitch, dt, -sample.gy)
+        roll_correction = self.roll_pid.update(self.roll_target - self.roll, dt, sample.gx)
+        self.correction = (pitch_correction, roll_correction)
+        return self._mix(pitch_correction, roll_correction)
+
+    def _mix(self, pitch_correction, roll_correction):
+        pose = self.pose
+        angles = {}
+        for joint, angle in pose.items():
+            angle += pitch_correction * self.pitch_mix.get(joint, 0.0) + roll_correction * self.roll_mix.get(joint, 0.0)
+            angles[joint] = max(0.0, min(180.0, angle))
+        return angles
+
+    # ----- real-time loop -----
+    def run(self, duration=None, stop=None):
+        """Run step() at 'rate' Hz on this thread until stopped."""
+        self._make_scheduler().run(duration, stop)
+
+    def start(self):
+        """Run the loop on a daemon thread."""
+        self._stopping.clear()
+        scheduler = self._make_scheduler()
+        self._thread = threading.Thread(target=scheduler.run, kwargs={"stop": self._stopping.is_set}, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _make_scheduler(self):
+        self.scheduler = RateScheduler()
+        self.scheduler.add_task("balance", 1.0 / self.rate, self.step)
+        return self.scheduler
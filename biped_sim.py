@@ -0,0 +1,261 @@
+import itertools
+import math
+import random
+
+import numpy as np
+
+from calibration import Calibration
+from hal import ImuSource, SimServoBus, SERVO_SLEW_US_PER_S
+from kinematics import NATURAL_STANDING_POSITION
+from mpu6050 import ImuSample
+from stability import pose_geometry_batch
+
+# ==========================
+# Biped Simulator
+# ==========================
+# A lightweight stand-in for the robot: the same six joints as
+# natural_standing_position, rigid links in the sagittal plane, and a body
+# that tips over the edge of its support polygon like an inverted pendulum,
+# independently in pitch and roll. Both feet are treated as on the floor,
+# so a shorter leg makes the body lean rather than stand on one foot. It
+# runs on its own clock, so a balance trial that takes ~15 s on the robot is
+# simulated in milliseconds, and it plugs in wherever a hal.ServoBus /
+# hal.ImuSource is expected.
+#
+# Frames: x forward, y left, z up, origin between the hips. Link lengths and
+# the joint conventions live in kinematics.py, masses and the support
+# region in stability.py.
+
+GRAVITY = 9.81
+
+# Tilt at which the robot counts as fallen
+FALL_ANGLE = math.radians(60)
+PHYSICS_DT = 0.001
+GEOMETRY_CACHE_SIZE = 4096
+
+
+def pose_geometry(angles):
+    """
+    Centre of mass and support region for a pose given in servo degrees,
+    from stability.pose_geometry_batch(). Returns
+    (com_x, com_y, com_height, (x_min, x_max), (y_min, y_max), body_pitch, body_roll)
+    with horizontal positions relative to the hips, heights above the floor
+    and angles in radians (pitch positive nose up, roll positive left side up).
+    """
+    g = pose_geometry_batch(angles)
+    return (float(g.com_x[0]), float(g.com_y[0]), float(g.com_height[0]), (float(g.x_min[0]), float(g.x_max[0])),
+            (float(g.y_min[0]), float(g.y_max[0])), float(g.pitch[0]), float(g.roll[0]))
+
+
+class _TipAxis:
+    """Tipping about one horizontal axis: angle u >= 0 over the edge on side s."""
+
+    def __init__(self):
+        self.angle = 0.0  # signed, radians
+        self.rate = 0.0
+
+    def at_rest(self, com, low, high):
+        return self.angle == 0.0 and self.rate == 0.0 and low <= com <= high
+
+    def step(self, dt, com, height, low, high):
+        if self.angle > 0 or (self.angle == 0 and com > high):
+            side, overhang = 1.0, com - high
+        elif self.angle < 0 or com < low:
+            side, overhang = -1.0, low - com
+        else:
+            self.rate = 0.0
+            return
+        u, w = side * self.angle, side * self.rate
+        w += GRAVITY * (overhang * math.cos(u) + height * math.sin(u)) / (overhang ** 2 + height ** 2) * dt
+        u += w * dt
+        if u <= 0.0:
+            u, w = 0.0, 0.0  # back on the support polygon; impacts are fully damped
+        self.angle, self.rate = side * u, side * w
+
+
+class BipedSimulator:
+    """
+    Simulated robot with a hal.ServoBus ('servos') and hal.ImuSource ('imu').
+
+    With the default virtual clock, time only moves when step()/run() is
+    called (or the cycle_mpu-style helpers below), as fast as the CPU allows.
+    Pass clock=time.monotonic to let it follow wall time instead; the state
+    is then brought up to date whenever a pose is sent or the IMU is read.
+    Pulsewidths are turned back into joint angles with 'calibration' (a
+    calibration.Calibration, default the built-in table), which must be the
+    one the poses were encoded with.
+    """
+
+    def __init__(self, clock=None, slew_rate=SERVO_SLEW_US_PER_S, accel_noise=0.0, gyro_noise=0.0,
+                 seed=None, physics_dt=PHYSICS_DT, calibration=None):
+        self.calibration = Calibration() if calibration is None else calibration
+        self.virtual = clock is None
+        self.now = 0.0 if self.virtual else clock()
+        self._clock = clock
+        self.physics_dt = physics_dt
+        self.pitch_axis = _TipAxis()
+        self.roll_axis = _TipAxis()
+        self.fallen = False
+        self._geometry = {}
+        self.servos = _BipedServoBus(self, slew_rate)
+        self.imu = _BipedImu(self, accel_noise, gyro_noise, seed)
+        self.servo_pins = self.servos.servo_pins
+
+    # ----- time -----
+    def clock(self):
+        return self.now if self.virtual else self._clock()
+
+    def step(self, dt):
+        """Advance the simulation by 'dt' seconds."""
+        self.advance_to(self.now + dt)
+
+    def sync(self):
+        if not self.virtual:
+            self.advance_to(self._clock())
+
+    def advance_to(self, t):
+        while self.now < t and not self.fallen:
+            settle = self.servos.settle_time(self.now)
+            if settle == 0.0:
+                # The pose is fixed: one geometry holds for every step
+                geometry = self.geometry(self.now)
+                com_x, com_y, height, (x_lo, x_hi), (y_lo, y_hi), _, _ = geometry
+                if self.pitch_axis.at_rest(com_x, x_lo, x_hi) and self.roll_axis.at_rest(com_y, y_lo, y_hi):
+                    break  # nothing moves until the next command
+                path = itertools.repeat(geometry[:5])
+            else:
+                # Servos are slewing: compute the geometry of every step until
+                # they settle in one vectorized call
+                steps = math.ceil(min(t - self.now, settle + self.physics_dt) / self.physics_dt)
+                path = self.geometry_path(self.now + self.physics_dt * np.arange(steps))
+            for com_x, com_y, height, (x_lo, x_hi), (y_lo, y_hi) in path:
+                dt = min(self.physics_dt, t - self.now)
+                if dt <= 0:
+                    break
+                self.pitch_axis.step(dt, com_x, height, x_lo, x_hi)
+                self.roll_axis.step(dt, com_y, height, y_lo, y_hi)
+                self.now += dt
+                if max(abs(self.pitch_axis.angle), abs(self.roll_axis.angle)) >= FALL_ANGLE:
+                    self.fallen = True
+                    break
+        self.now = max(self.now, t)
+
+    # ----- state -----
+    def joint_angles(self, now=None):
+        """Actual (slewed) servo angles in degrees, defaulting to the natural pose."""
+        angles = dict(NATURAL_STANDING_POSITION)
+        for joint, pin in self.servo_pins.items():
+            pulsewidth = self.servos.position(pin, now)
+            if pulsewidth:
+                angles[joint] = self.calibration.angle(joint, pulsewidth)
+        return angles
+
+    def geometry(self, now=None):
+        angles = self.joint_angles(now)
+        key = tuple(round(angles[joint], 3) for joint in NATURAL_STANDING_POSITION)
+        geometry = self._geometry.get(key)
+        if geometry is None:
+            if len(self._geometry) >= GEOMETRY_CACHE_SIZE:
+                self._geometry.clear()
+            geometry = self._geometry[key] = pose_geometry(angles)
+        return geometry
+
+    def geometry_path(self, times):
+        """pose_geometry() without the body angles at each of 'times', as a list of tuples."""
+        columns = []
+        for joint, natural in NATURAL_STANDING_POSITION.items():
+            pulsewidth = self.servos.path(self.servo_pins[joint], times)
+            angle = self.calibration.angle(joint, pulsewidth)
+            columns.append(np.where(pulsewidth > 0, angle, natural))
+        g = pose_geometry_batch(np.stack(columns, axis=-1))
+        return list(zip(g.com_x.tolist(), g.com_y.tolist(), g.com_height.tolist(),
+                        zip(g.x_min.tolist(), g.x_max.tolist()), zip(g.y_min.tolist(), g.y_max.tolist())))
+
+    def attitude(self):
+        """
+        Body (pitch, roll) in degrees and their rates in °/s, in the fusion.py
+        convention. Tipping forward or to the left lowers pitch or roll.
+        """
+        body_pitch, body_roll = self.geometry()[5:]
+        return (math.degrees(body_pitch - self.pitch_axis.angle), math.degrees(body_roll - self.roll_axis.angle),
+                -math.degrees(self.pitch_axis.rate), -math.degrees(self.roll_axis.rate))
+
+    def reset(self, pose=None):
+        """Stand upright again, optionally snapping straight to 'pose'."""
+        self.pitch_axis = _TipAxis()
+        self.roll_axis = _TipAxis()
+        self.fallen = False
+        if pose is not None:
+            self.servos.snap(self.calibration.frame(pose, self.servo_pins))
+
+    # ----- cycle_mpu.py equivalents -----
+    def move_all_servos(self, angles, settle=0.1):
+        self.servos.commit_frame(self.calibration.frame(angles, self.servo_pins))
+        self.step(settle)
+
+    def execute_pattern(self, pattern, base_position, hold=0.5):
+        for step in pattern:
+            self.move_all_servos(step)
+            self.step(hold)
+        self.move_all_servos(base_position)
+        self.step(hold)
+
+    def measure_stability(self, samples=10, interval=0.05):
+        """Mean |pitch| and |roll| of 'samples' IMU-derived readings, like cycle_mpu.py."""
+        pitch_sum = roll_sum = 0.0
+        for _ in range(samples):
+            pitch, roll, _, _ = self.attitude()
+            pitch_sum += abs(pitch)
+            roll_sum += abs(roll)
+            self.step(interval)
+        return pitch_sum / samples, roll_sum / samples
+
+
+class _BipedServoBus(SimServoBus):
+    def __init__(self, sim, slew_rate):
+        super().__init__(slew_rate=slew_rate, clock=sim.clock)
+        self.sim = sim
+
+    def _commit(self, pulsewidths):
+        self.sim.sync()
+        return super()._commit(pulsewidths)
+
+    def path(self, pin, times):
+        """position() at each of 'times' as an array."""
+        times = np.asarray(times, dtype=float)
+        target = self.commanded.get(pin, 0)
+        start, since = self._moves.get(pin, (0, 0.0))
+        if target == 0 or start == 0:
+            return np.full(times.shape, float(target))
+        travel = np.maximum(self.slew_rate * (times - since), 0.0)
+        return np.where(abs(target - start) <= travel, float(target), start + np.sign(target - start) * travel)
+
+    def snap(self, pulsewidths):
+        """Put servos at 'pulsewidths' instantly (for resetting between trials)."""
+        now = self.clock()
+        for pin, pulsewidth in pulsewidths.items():
+            self.commanded[pin] = int(pulsewidth)
+            self._moves[pin] = (int(pulsewidth), now)
+
+
+class _BipedImu(ImuSource):
+    def __init__(self, sim, accel_noise, gyro_noise, seed):
+        super().__init__()
+        self.sim = sim
+        self.accel_noise = accel_noise
+        self.gyro_noise = gyro_noise
+        self.random = random.Random(seed)
+
+    def _read(self):
+        self.sim.sync()
+        pitch, roll, pitch_rate, roll_rate = self.sim.attitude()
+        p, r = math.radians(pitch), math.radians(roll)
+        g = self.random.gauss
+        a_sd, g_sd = self.accel_noise, self.gyro_noise
+        # Same axis conventions as fusion.py: pitch rate is -gy, roll rate is +gx
+        return ImuSample(
+            self.sim.clock(),
+            math.sin(p) + g(0, a_sd), math.cos(p) * math.sin(r) + g(0, a_sd), math.cos(p) * math.cos(r) + g(0, a_sd),
+            25.0,
+            roll_rate + g(0, g_sd), -pitch_rate + g(0, g_sd), g(0, g_sd),
+        )
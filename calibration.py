@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+
+# ==========================
+# Servo Calibration
+# ==========================
+# The one place that turns joint angles into servo pulsewidths. Every joint
+# has its pulse range, a trim, a direction and safe angle limits:
+#
+#   servo angle = trim + (angle if direction > 0 else 180 - angle)
+#   pulsewidth  = min_pulse + (max_pulse - min_pulse) * servo angle / 180
+#
+# with 'angle' first clamped to min_angle..max_angle and the pulse to
+# min_pulse..max_pulse. Angles are the ones the scripts use for poses, so
+# natural_standing_position still means the same thing.
+#
+# Only Right Toe is reversed. The mirrored knees are already handled in the
+# pose values (Knee Left 120 / Knee Right 60 when standing). gui.py and
+# test_gui.py said Knee Right was reversed too, but they tested for "Right
+# Knee", which no pose contains, so no script ever reversed it.
+#
+# A Calibration compiles the table into one integer lookup table per joint
+# at LUT_RESOLUTION steps per degree. A whole pose or trajectory becomes
+# pulsewidths with one array index, with no per-joint branches. After
+# re-horning a servo, edit its trim or range in calibration.json (written
+# by save_calibration(); $ROBOT_CALIBRATION overrides the path). Gaits cached
+# with a calibration are rebuilt automatically, because the calibration's
+# digest is part of their key.
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration.json")
+LUT_RESOLUTION = 10  # entries per degree
+
+JointCalibration = namedtuple("JointCalibration", "min_pulse max_pulse trim direction min_angle max_angle")
+
+# 500-2500 µs over 0-180°, as every script has used. The toe servos stop at
+# 160°, the limit left_toe.py enforces. The limits are in pose angles, before
+# the reversal, so for Right Toe servo 0-160° is pose 20-180°.
+DEFAULT_CALIBRATION = {
+    "Hip Left": JointCalibration(500, 2500, 0.0, 1, 0.0, 180.0),
+    "Knee Left": JointCalibration(500, 2500, 0.0, 1, 0.0, 180.0),
+    "Hip Right": JointCalibration(500, 2500, 0.0, 1, 0.0, 180.0),
+    "Knee Right": JointCalibration(500, 2500, 0.0, 1, 0.0, 180.0),
+    "Left Toe": JointCalibration(500, 2500, 0.0, 1, 0.0, 160.0),
+    "Right Toe": JointCalibration(500, 2500, 0.0, -1, 20.0, 180.0),
+}
+
+
+class Calibration:
+    """
+    Compiled angle -> pulsewidth conversion for a set of joints:
+
+        calibration = load_calibration()
+        servos.commit_frame(calibration.frame(pose, servos.servo_pins))
+        pulsewidths = calibration.pulsewidths(trajectory.angles, trajectory.joints)   # (N, J) ints
+    """
+
+    def __init__(self, joints=None):
+        self.joints = {joint: JointCalibration(*values) for joint, values in (joints or DEFAULT_CALIBRATION).items()}
+        for joint, values in self.joints.items():
+            if values.direction not in (1, -1):
+                raise ValueError(f"{joint!r}: direction must be 1 or -1, got {values.direction}")
+            if not 0 <= values.min_angle <= values.max_angle <= 180:
+                raise ValueError(f"{joint!r}: need 0 <= min_angle <= max_angle <= 180")
+            if not 0 < values.min_pulse < values.max_pulse:
+                raise ValueError(f"{joint!r}: need 0 < min_pulse < max_pulse")
+        self.names = tuple(self.joints)
+        self.index = {joint: i for i, joint in enumerate(self.names)}
+
+        table = np.array([self.joints[joint] for joint in self.names], dtype=float).reshape(-1, 6)
+        min_pulse, max_pulse, trim, direction, min_angle, max_angle = table.T
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+        # Row j, column i is the pulsewidth for i / LUT_RESOLUTION degrees,
+        # with the safe limits and pulse range already applied
+        angles = np.clip(np.arange(180 * LUT_RESOLUTION + 1) / LUT_RESOLUTION, min_angle[:, None], max_angle[:, None])
+        servo_angles = trim[:, None] + np.where(direction[:, None] > 0, angles, 180.0 - angles)
+        pulses = min_pulse[:, None] + (max_pulse - min_pulse)[:, None] * servo_angles / 180.0
+        self.lut = np.rint(np.clip(pulses, min_pulse[:, None], max_pulse[:, None])).astype(np.uint16)
+        # The same rows as Python lists, for single poses where numpy's call overhead dominates
+        self._rows_by_joint = dict(zip(self.names, self.lut.tolist()))
+
+    def pulsewidths(self, angles, joints=None):
+        """Pulsewidths for an (..., J) array of angles in 'joints' order (default: all, in order)."""
+        rows = self._rows(joints)
+        index = (np.clip(np.asarray(angles, dtype=float), 0.0, 180.0) * LUT_RESOLUTION + 0.5).astype(np.intp)
+        return self.lut[rows, index]
+
+    def pulsewidth(self, joint, angle):
+        return self._rows_by_joint[joint][int(min(180.0, max(0.0, angle)) * LUT_RESOLUTION + 0.5)]
+
+    def angle(self, joint, pulsewidth):
+        """
+        Pose angle 'pulsewidth' drives 'joint' to: the inverse of pulsewidth(),
+        without the limits. 'pulsewidth' may be a number or a numpy array.
+        """
+        values = self.joints[joint]
+        servo_angle = (pulsewidth - values.min_pulse) / (values.max_pulse - values.min_pulse) * 180.0 - values.trim
+        return servo_angle if values.direction > 0 else 180.0 - servo_angle
+
+    def frame(self, pose, servo_pins):
+        """{pin: pulsewidth} frame for a joint -> angle pose."""
+        rows = self._rows_by_joint
+        return {servo_pins[joint]: rows[joint][int(min(180.0, max(0.0, angle)) * LUT_RESOLUTION + 0.5)]
+                for joint, angle in pose.items()}
+
+    def limit(self, pose):
+        """'pose' with every angle clamped to its joint's safe limits."""
+        return {joint: min(self.joints[joint].max_angle, max(self.joints[joint].min_angle, angle))
+                for joint, angle in pose.items()}
+
+    def digest(self):
+        """Short hash of the table, for cache keys."""
+        content = json.dumps({joint: list(values) for joint, values in self.joints.items()}, sort_keys=True)
+        return hashlib.sha256(content.encode()).hexdigest()[:20]
+
+    def _rows(self, joints):
+        if joints is None:
+            return np.arange(len(self.names))
+        try:
+            return np.array([self.index[joint] for joint in joints], dtype=np.intp)
+        except KeyError as error:
+            raise ValueError(f"no calibration for joint {error.args[0]!r}") from None
+
+
+def load_calibration(path=None):
+    """Calibration from 'path', $ROBOT_CALIBRATION or calibration.json; the defaults when there is none."""
+    path = path or os.environ.get("ROBOT_CALIBRATION", DEFAULT_PATH)
+    joints = dict(DEFAULT_CALIBRATION)
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except FileNotFoundError:
+        stored = {}
+    for joint, values in stored.items():
+        joints[joint] = JointCalibration(**values)
+    return Calibration(joints)
+
+
+def save_calibration(calibration, path=None):
+    path = path or os.environ.get("ROBOT_CALIBRATION", DEFAULT_PATH)
+    with open(path, "w") as f:
+        json.dump({joint: values._asdict() for joint, values in calibration.joints.items()}, f, indent=4)
+        f.write("\n")
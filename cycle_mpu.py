@@ -1,86 +1,79 @@
-import pigpio
-import smbus
+import argparse
 import time
-import math
 import random
 
+from balance import BalanceController
+from calibration import load_calibration
+from experiment_store import ExperimentStore
+from fall_detector import FallGuard
+from hal import open_imu, open_servo_bus, select_backend
+from optimizer import Candidate, PatternOptimizer, start_pool, validate_on_hardware
+from runtime import ControlRuntime
+from stability import check_pattern
+from stability_monitor import StabilityMonitor
+
+# --optimize searches the pattern offsets on simulated robots first and only
+# tries the best few on the hardware, instead of the hill-climb below
+parser = argparse.ArgumentParser()
+parser.add_argument("--optimize", action="store_true")
+parser.add_argument("--generations", type=int, default=40)
+parser.add_argument("--top-k", type=int, default=3)
+# --balance keeps the body level with the 200 Hz closed loop in balance.py
+# while the patterns run; runtime.py overlaps its IMU reads and servo writes
+parser.add_argument("--balance", action="store_true")
+args, _ = parser.parse_known_args()
+
+# The optimizer's simulation workers are forked, so start them while this
+# process has no other threads yet
+pool = start_pool() if args.optimize else None
+
 # ==========================
 # Hardware Setup
 # ==========================
-pi = pigpio.pi()
-if not pi.connected:
-    print("Failed to connect to pigpio daemon")
+try:
+    servos = open_servo_bus()  # pigpio unless --backend or ROBOT_BACKEND picks pca9685 or sim
+except ConnectionError as e:
+    print(e)
     exit()
 
-servo_pins = {
-    "Hip Left": 23,
-    "Knee Left": 22,
-    "Hip Right": 27,
-    "Knee Right": 17,
-    "Left Toe": 16,
-    "Right Toe": 26,
-}
+servo_pins = servos.servo_pins
+calibration = load_calibration()
 
-# I2C and MPU6050
-MPU6050_ADDR = 0x68
-PWR_MGMT_1 = 0x6B
-ACCEL_XOUT_H = 0x3B
-GYRO_XOUT_H = 0x43
-bus = smbus.SMBus(1)  # I2C bus 1 on Raspberry Pi
+# MPU6050 on I2C bus 1 (or the simulated IMU)
+imu = open_imu()
+# Pitch/roll statistics over sliding windows of the IMU stream, sampled in the
+# background (or fed by the balance loop), so measuring stability never blocks
+STABILITY_WINDOW = 0.5  # s, the hold at the end of execute_pattern()
+monitor = StabilityMonitor(windows=(0.1, STABILITY_WINDOW, 10.0))
 
-def init_mpu():
-    bus.write_byte_data(MPU6050_ADDR, PWR_MGMT_1, 0)
-
-init_mpu()
+# Scores of earlier runs, reused for a day (see experiment_store.py). They are
+# kept apart per backend (the one behind the broker too) and per control mode,
+# since a pattern under the balance loop scores differently than open loop
+store = ExperimentStore()
+backend = select_backend()
+if backend == "broker":
+    backend = f"broker:{servos.backend}"
+source = f"{backend}/{'balance' if args.balance else 'open-loop'}"
 
 # ==========================
 # Functions
 # ==========================
-def set_servo_angle(pin, angle, reverse=False):
-    if reverse:
-        angle = 180 - angle
-    pulsewidth = 500 + (angle / 180.0) * 2000
-    pulsewidth = max(500, min(2500, pulsewidth))
-    pi.set_servo_pulsewidth(pin, pulsewidth)
+def send_pose(angles):
+    servos.commit_frame(calibration.frame(angles, servo_pins))  # one round trip per pose, only when it changed
 
 def move_all_servos(angles):
-    for joint, angle in angles.items():
-        reverse = joint in ["Right Toe"]
-        set_servo_angle(servo_pins[joint], angle, reverse)
+    if balancer is not None:
+        balancer.set_pose(angles)  # the balance loop sends it, corrected
+    else:
+        guard.output(angles)  # dropped once a fall has been detected
     time.sleep(0.1)
 
-def read_raw_data(addr):
-    high = bus.read_byte_data(MPU6050_ADDR, addr)
-    low = bus.read_byte_data(MPU6050_ADDR, addr+1)
-    value = (high << 8) | low
-    if value > 32768:
-        value = value - 65536
-    return value
-
 def read_mpu_data():
-    ax = read_raw_data(ACCEL_XOUT_H)
-    ay = read_raw_data(ACCEL_XOUT_H + 2)
-    az = read_raw_data(ACCEL_XOUT_H + 4)
-
-    ax_g = ax/16384.0
-    ay_g = ay/16384.0
-    az_g = az/16384.0
-
-    pitch = math.degrees(math.atan2(ax_g, math.sqrt(ay_g*ay_g + az_g*az_g)))
-    roll = math.degrees(math.atan2(ay_g, az_g))
-    return pitch, roll
-
-def measure_stability(samples=10):
-    pitch_sum = 0
-    roll_sum = 0
-    for _ in range(samples):
-        pitch, roll = read_mpu_data()
-        pitch_sum += abs(pitch)
-        roll_sum += abs(roll)
-        time.sleep(0.05)
-    avg_pitch_dev = pitch_sum / samples
-    avg_roll_dev = roll_sum / samples
-    return avg_pitch_dev, avg_roll_dev
+    return monitor.pitch, monitor.roll
+
+def measure_stability():
+    """Mean |pitch| and |roll| over the last STABILITY_WINDOW seconds."""
+    return monitor.deviation(STABILITY_WINDOW)
 
 def clamp_angle(angle):
     return max(0, min(180, angle))
@@ -99,7 +92,19 @@ base_position = {
     "Right Toe": 110
 }
 
+# Every IMU sample is checked for a fall; on a fall all motion is dropped
+# and the robot crouches
+guard = FallGuard(send_pose, base_position)
+monitor.listeners.append(guard.update)
+
+balancer = None
 move_all_servos(base_position)
+if args.balance:
+    balancer = BalanceController(imu, guard.output, base_position, monitor=monitor)
+    balance_runtime = ControlRuntime(imu, balancer.correct, guard.output, rate=balancer.rate)
+    balance_runtime.start()
+else:
+    monitor.start(imu)
 time.sleep(1)
 
 # A small movement pattern (like shifting weight)
@@ -136,22 +141,61 @@ def execute_pattern(pattern):
     move_all_servos(base_position)
     time.sleep(0.5)
 
-# Measure initial stability
-best_pattern = [step.copy() for step in movement_pattern]
-best_pitch_dev, best_roll_dev = measure_stability()
-best_score = best_pitch_dev + best_roll_dev
-print(f"Initial stability score: {best_score:.2f}")
+def score_pattern(pattern):
+    """execute_pattern() + measure_stability(), unless this pattern was measured recently."""
+    cached = store.lookup(pattern, base_position, source)
+    if cached is not None:
+        return cached.pitch_dev, cached.roll_dev
+    execute_pattern(pattern)
+    pitch_dev, roll_dev = measure_stability()
+    store.record(Candidate(pitch_dev + roll_dev, pitch_dev, roll_dev, pattern), base_position, source)
+    return pitch_dev, roll_dev
+
+# Warm start from the best pattern of earlier runs, else measure initial stability
+known = store.best(base_position, source)
+if known:
+    best_pattern = known[0].pattern
+    best_score = known[0].score
+    print(f"Best known stability score: {best_score:.2f}")
+else:
+    best_pattern = [step.copy() for step in movement_pattern]
+    best_pitch_dev, best_roll_dev = measure_stability()
+    best_score = best_pitch_dev + best_roll_dev
+    print(f"Initial stability score: {best_score:.2f}")
 
-ITERATIONS = 10
+ITERATIONS = 0 if args.optimize else 10
 THRESHOLD_IMPROVEMENT = 0.5
 ADJUST_STEP = 2
+# Candidates whose centre of mass comes closer than this to the edge of the
+# feet (in metres) at any point are rejected without running them
+MIN_SUPPORT_MARGIN = 0.005
+
+if args.optimize:
+    with PatternOptimizer(best_pattern, base_position, store=store, executor=pool) as optimizer:
+        optimizer.run(args.generations)
+        shortlist = optimizer.top(args.top_k)
+    # The optimizer's own lookups are not robot measurements
+    store.hits = store.misses = 0
+    print(f"Simulated {optimizer.evaluations} candidates, validating the best {len(shortlist)} on the robot")
+    validated = [store.lookup(candidate.pattern, base_position, source) for candidate in shortlist]
+    untried = [candidate for candidate, known in zip(shortlist, validated) if known is None]
+    for candidate in validate_on_hardware(untried, execute_pattern, measure_stability):
+        store.record(candidate, base_position, source)
+        validated.append(candidate)
+    validated = sorted((candidate for candidate in validated if candidate is not None), key=lambda c: c.score)
+    for candidate in validated:
+        print(f"Candidate score: {candidate.score:.2f}")
+    if validated and validated[0].score < best_score:
+        best_pattern = validated[0].pattern
+        best_score = validated[0].score
+        print("Found improved pattern!")
 
 for i in range(ITERATIONS):
+    if guard.tripped.is_set():
+        break
     print(f"Iteration {i+1}...")
-    # Execute current best pattern
-    execute_pattern(best_pattern)
-    # Measure stability
-    c_pitch_dev, c_roll_dev = measure_stability()
+    # Execute current best pattern and measure stability (skipped when measured recently)
+    c_pitch_dev, c_roll_dev = score_pattern(best_pattern)
     candidate_score = c_pitch_dev + c_roll_dev
     print(f"Candidate score: {candidate_score:.2f}")
 
@@ -184,14 +228,21 @@ for i in range(ITERATIONS):
             step["Knee Right"] = clamp_angle(step["Knee Right"] - roll_correction)
             step["Right Toe"] = clamp_angle(step["Right Toe"] + roll_correction)
 
+    # Skip candidates the static model says would tip over
+    stable, margins, worst = check_pattern(candidate_pattern, base_position, MIN_SUPPORT_MARGIN)
+    if not stable:
+        print(f"Candidate rejected: support margin {margins[worst] * 1000:.1f} mm")
+        continue
+
     # Test the candidate pattern
-    execute_pattern(candidate_pattern)
-    c_pitch_dev2, c_roll_dev2 = measure_stability()
+    c_pitch_dev2, c_roll_dev2 = score_pattern(candidate_pattern)
     candidate_score2 = c_pitch_dev2 + c_roll_dev2
     print(f"Adjusted candidate score: {candidate_score2:.2f}")
 
     # Decide if improved
-    if candidate_score2 < best_score - THRESHOLD_IMPROVEMENT:
+    if guard.tripped.is_set():
+        print("Fall detected, crouching.")
+    elif candidate_score2 < best_score - THRESHOLD_IMPROVEMENT:
         best_pattern = candidate_pattern
         best_score = candidate_score2
         print("Found improved pattern!")
@@ -203,9 +254,23 @@ move_all_servos(base_position)
 time.sleep(1)
 
 print(f"Final best score: {best_score:.2f}")
+print(f"Servo frames: {servos.latency}")
+print(f"IMU reads: {imu.latency}")
+print(f"Stored scores reused: {store.hits}, measured: {store.misses}")
+if guard.tripped.is_set():
+    print(f"Fall detected, sample-to-crouch latency: {guard.latency}")
+if balancer is not None:
+    balance_runtime.stop()
+    print(f"Balance loop: {balance_runtime.report()}")
+else:
+    monitor.stop()
+gyro = monitor.stats(10.0).gyro
+print(f"Last 10 s: gyro rate rms {gyro.rms:.2f}°/s, peak-to-peak {gyro.peak_to_peak:.2f}°/s")
 
 # Cleanup
-for pin in servo_pins.values():
-    pi.set_servo_pulsewidth(pin, 0)
-pi.stop()
+servos.close()
+imu.close()
+store.close()
+if pool is not None:
+    pool.shutdown()
 print("Cleanup complete, servos off.")
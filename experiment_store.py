@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from optimizer import Candidate
+
+# ==========================
+# Experiment Store
+# ==========================
+# SQLite record of every balance pattern that was scored, so runs of
+# cycle_mpu.py and the optimizer can reuse each other's measurements. A row
+# is keyed by a hash of the pattern and of the base position it returns to,
+# and by its source: how it was measured, e.g. "pigpio/open-loop" or
+# "broker:pca9685/balance" from cycle_mpu.py, or optimizer.SIM_SOURCE for
+# simulated scores. Scores older than the caller's TTL are ignored, since the
+# robot itself drifts (battery, wear, trim).
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "experiments.db")
+DEFAULT_TTL = 24 * 3600  # seconds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    id INTEGER PRIMARY KEY,
+    pattern_hash TEXT NOT NULL,
+    base_hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    score REAL NOT NULL,
+    pitch_dev REAL NOT NULL,
+    roll_dev REAL NOT NULL,
+    pattern TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS experiments_lookup ON experiments (pattern_hash, source, created);
+CREATE INDEX IF NOT EXISTS experiments_best ON experiments (base_hash, source, score);
+"""
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:20]
+
+
+def _rounded(pose):
+    return {joint: round(float(angle), 3) for joint, angle in pose.items()}
+
+
+def pattern_hash(pattern, base_position):
+    """Key of a pattern run from and back to 'base_position' (angles rounded to 0.001°)."""
+    return _digest([[_rounded(step) for step in pattern], _rounded(base_position)])
+
+
+def base_hash(base_position):
+    return _digest(_rounded(base_position))
+
+
+class ExperimentStore:
+    """
+    Scores of patterns by source. The path defaults to $EXPERIMENT_DB or
+    experiments.db next to this module; ":memory:" keeps nothing.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, clock=time.time):
+        self.path = path or os.environ.get("EXPERIMENT_DB", DEFAULT_PATH)
+        self.ttl = ttl
+        self.clock = clock
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.close()
+
+    def record(self, candidate, base_position, source):
+        """Store a Candidate measured by 'source'."""
+        with self.db:
+            self.db.execute(
+                "INSERT INTO experiments (pattern_hash, base_hash, source, score, pitch_dev, roll_dev, pattern, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (pattern_hash(candidate.pattern, base_position), base_hash(base_position), source,
+                 candidate.score, candidate.pitch_dev, candidate.roll_dev,
+                 json.dumps([_rounded(step) for step in candidate.pattern]), self.clock()))
+
+    def lookup(self, pattern, base_position, source, ttl=None):
+        """Newest Candidate for 'pattern' from 'source' within the TTL, or None."""
+        row = self.db.execute(
+            "SELECT score, pitch_dev, roll_dev FROM experiments"
+            " WHERE pattern_hash = ? AND source = ? AND created >= ? ORDER BY created DESC LIMIT 1",
+            (pattern_hash(pattern, base_position), source, self._since(ttl))).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return Candidate(*row, pattern)
+
+    def best(self, base_position, source, k=1, ttl=None):
+        """Up to 'k' best distinct Candidates around 'base_position' within the TTL."""
+        rows = self.db.execute(
+            "SELECT MIN(score), pitch_dev, roll_dev, pattern FROM experiments"
+            " WHERE base_hash = ? AND source = ? AND created >= ?"
+            " GROUP BY pattern_hash ORDER BY MIN(score) LIMIT ?",
+            (base_hash(base_position), source, self._since(ttl), k)).fetchall()
+        return [Candidate(score, pitch_dev, roll_dev, json.loads(pattern))
+                for score, pitch_dev, roll_dev, pattern in rows]
+
+    def _since(self, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        return self.clock() - ttl if ttl is not None else float("-inf")
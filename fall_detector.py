@@ -0,0 +1,140 @@
+import threading
+import time
+
+from hal import LatencyStats
+from trajectory import compile_keyframes
+
+# ==========================
+# Fall Detection
+# ==========================
+# FallDetector watches fused pitch/roll and their rates sample by sample and
+# reports a fall as soon as the body is past TILT_LIMIT, or already leaning
+# and rotating fast enough to get there within LOOKAHEAD. CONFIRM_SAMPLES
+# consecutive hits are required, so at 200 Hz a fall is flagged 5-10 ms
+# after it becomes visible in the data.
+#
+# FallGuard turns a detection into a protective crouch: it sits between the
+# motion code and the servos, drops every pose sent after the trip, and
+# plays a crouch trajectory compiled when it was created. The time from the
+# triggering sample's timestamp to the first crouch command is recorded.
+
+TILT_LIMIT = 40.0    # degrees, past this the robot is falling
+WARN_TILT = 15.0     # degrees, rate prediction only applies beyond this lean
+LOOKAHEAD = 0.1      # seconds of extrapolation at the current rate
+CONFIRM_SAMPLES = 2
+
+# Crouching.py's crouch(): knees fully bent and toes down, hips unchanged
+CROUCH_POSITION = {
+    "Left Toe": 160,
+    "Right Toe": 160,
+    "Knee Left": 180,
+    "Knee Right": 0,
+}
+CROUCH_TIME = 0.2    # seconds, about as fast as the knees can slew
+CROUCH_RATE = 200    # Hz
+
+
+class FallDetector:
+    """Per-sample fall test on (pitch, roll) in degrees and their rates in °/s."""
+
+    def __init__(self, tilt_limit=TILT_LIMIT, warn_tilt=WARN_TILT, lookahead=LOOKAHEAD, confirm=CONFIRM_SAMPLES):
+        self.tilt_limit = tilt_limit
+        self.warn_tilt = warn_tilt
+        self.lookahead = lookahead
+        self.confirm = confirm
+        self.hits = 0
+
+    def falling(self, angle, rate):
+        if abs(angle) >= self.tilt_limit:
+            return True
+        # Leaning and rotating further away from upright
+        return (abs(angle) >= self.warn_tilt and angle * rate > 0
+                and abs(angle + rate * self.lookahead) >= self.tilt_limit)
+
+    def update(self, pitch, roll, pitch_rate, roll_rate):
+        """True once the fall has been seen on 'confirm' consecutive samples."""
+        if self.falling(pitch, pitch_rate) or self.falling(roll, roll_rate):
+            self.hits += 1
+        else:
+            self.hits = 0
+        return self.hits >= self.confirm
+
+    def reset(self):
+        self.hits = 0
+
+
+class FallGuard:
+    """
+    Pose output with fall protection. Send motion through guard.output(angles)
+    and feed every IMU sample to guard.update(sample, pitch, roll); after a
+    fall, output() ignores the motion code and the crouch runs instead.
+
+        guard = FallGuard(send_pose, base_position)
+        monitor.listeners.append(guard.update)
+        ...
+        if guard.tripped.is_set(): stop walking
+
+    'clock' must be the clock the IMU stamps its samples with.
+    """
+
+    def __init__(self, output, base_position, detector=None, crouch=CROUCH_POSITION, crouch_time=CROUCH_TIME,
+                 rate=CROUCH_RATE, clock=time.monotonic):
+        self.send = output
+        self.detector = detector or FallDetector()
+        self.clock = clock
+        self.rate = rate
+        self.tripped = threading.Event()
+        self.latency = LatencyStats()
+        self.trip_sample = None
+        # Precompiled from the base position; the first row is the base position itself
+        trajectory = compile_keyframes([base_position, crouch], crouch_time, rate, profile="minjerk",
+                                       joints=tuple(base_position), start=base_position)
+        self.crouch_frames = [trajectory.pose(i) for i in range(1, len(trajectory))]
+        self._lock = threading.Lock()
+        self._player = None
+
+    def output(self, angles):
+        """Forward a pose from the motion code unless a fall has been detected."""
+        with self._lock:
+            if not self.tripped.is_set():
+                self.send(angles)
+
+    def update(self, sample, pitch, roll):
+        """Check one sample; returns True if it triggered the crouch."""
+        if self.tripped.is_set():
+            return False
+        # Same axes as fusion.ComplementaryFilter: pitch rate is -gy, roll rate is gx
+        if not self.detector.update(pitch, roll, -sample.gy, sample.gx):
+            return False
+        self.trip(sample)
+        return True
+
+    def trip(self, sample=None):
+        """Preempt the motion code and start the crouch now."""
+        with self._lock:
+            if self.tripped.is_set():
+                return
+            self.tripped.set()
+            self.trip_sample = sample
+            self.send(self.crouch_frames[0])
+        if sample is not None:
+            self.latency.add(self.clock() - sample.timestamp)
+        self._player = threading.Thread(target=self._play_crouch, daemon=True)
+        self._player.start()
+
+    def reset(self):
+        """Hand the servos back to the motion code (after the robot is picked up)."""
+        if self._player is not None:
+            self._player.join()
+            self._player = None
+        self.detector.reset()
+        self.trip_sample = None
+        self.tripped.clear()
+
+    def _play_crouch(self):
+        period = 1.0 / self.rate
+        next_frame = time.monotonic()
+        for frame in self.crouch_frames[1:]:
+            next_frame += period
+            time.sleep(max(0.0, next_frame - time.monotonic()))
+            self.send(frame)
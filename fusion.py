@@ -0,0 +1,216 @@
+import math
+
+import numpy as np
+
+# ==========================
+# Attitude from the MPU6050
+# ==========================
+# Pitch and roll follow the convention the scripts already use:
+#   pitch = atan2(ax, sqrt(ay^2 + az^2)), roll = atan2(ay, az)
+# With that convention the matching body rates are -gy for pitch and
+# +gx for roll. All angles are in degrees and rates in °/s.
+
+# Gaps longer than this (e.g. between two measure_stability() calls) are
+# not integrated; the filter re-seeds from the accelerometer instead.
+MAX_DT = 0.5
+
+
+def accel_angles(ax, ay, az):
+    """Pitch and roll in degrees from one accelerometer reading."""
+    pitch = math.degrees(math.atan2(ax, math.sqrt(ay * ay + az * az)))
+    roll = math.degrees(math.atan2(ay, az))
+    return pitch, roll
+
+
+def accel_angles_batch(accel):
+    """Vectorized accel_angles() for an (N, 3) array; returns an (N, 2) array."""
+    accel = np.asarray(accel, dtype=float)
+    ax, ay, az = accel[:, 0], accel[:, 1], accel[:, 2]
+    pitch = np.degrees(np.arctan2(ax, np.sqrt(ay * ay + az * az)))
+    roll = np.degrees(np.arctan2(ay, az))
+    return np.column_stack((pitch, roll))
+
+
+def gyro_rates_batch(gyro):
+    """(N, 3) gyro array in °/s to an (N, 2) array of pitch and roll rates."""
+    gyro = np.asarray(gyro, dtype=float)
+    return np.column_stack((-gyro[:, 1], gyro[:, 0]))
+
+
+def _dt_array(dt, n):
+    dt = np.asarray(dt, dtype=float)
+    if dt.ndim == 0:
+        return np.full(n, float(dt))
+    if dt.shape != (n,):
+        raise ValueError(f"dt must be a scalar or have shape ({n},), got {dt.shape}")
+    return dt
+
+
+# ==========================
+# Complementary Filter
+# ==========================
+class ComplementaryFilter:
+    """
+    Blend the integrated gyro rate (trusted short term) with the accelerometer
+    angle (trusted long term): angle = alpha * (angle + rate * dt) + (1 - alpha) * accel.
+    """
+
+    def __init__(self, alpha=0.98, max_dt=MAX_DT):
+        self.alpha = alpha
+        self.max_dt = max_dt
+        self.pitch = None
+        self.roll = None
+        self.timestamp = None
+
+    def update(self, sample, dt=None):
+        """
+        Feed one ImuSample; returns the fused (pitch, roll). A sample with
+        dt == 0 (the same reading again) is skipped.
+        """
+        if dt is None and self.timestamp is not None:
+            dt = sample.timestamp - self.timestamp
+        if dt == 0 and self.pitch is not None:
+            return self.pitch, self.roll
+        self.timestamp = sample.timestamp
+
+        acc_pitch, acc_roll = accel_angles(sample.ax, sample.ay, sample.az)
+        if self.pitch is None or dt is None or not 0 < dt <= self.max_dt:
+            self.pitch, self.roll = acc_pitch, acc_roll
+        else:
+            a = self.alpha
+            self.pitch = a * (self.pitch - sample.gy * dt) + (1 - a) * acc_pitch
+            self.roll = a * (self.roll + sample.gx * dt) + (1 - a) * acc_roll
+        return self.pitch, self.roll
+
+
+def complementary_batch(accel, gyro, dt, alpha=0.98):
+    """
+    Run the complementary filter over a recorded log.
+
+    'accel' and 'gyro' are (N, 3) arrays in g and °/s; 'dt' is a scalar or an
+    (N,) array of sample spacings (dt[0] is ignored). Returns (N, 2) pitch/roll.
+
+    The recursion angle[k] = a * angle[k-1] + u[k] is solved in closed form,
+    a^(k+1) * (c + cumsum(u * a^-(i+1))), one block at a time so a^-k stays
+    well inside float range.
+    """
+    acc = accel_angles_batch(accel)
+    rates = gyro_rates_batch(gyro)
+    n = len(acc)
+    out = np.empty_like(acc)
+    if n == 0:
+        return out
+
+    u = alpha * rates * _dt_array(dt, n)[:, None] + (1 - alpha) * acc
+    out[0] = acc[0]
+    if alpha <= 0.0:
+        out[1:] = u[1:]
+        return out
+
+    block = max(1, int(18.0 / -math.log(alpha))) if alpha < 1.0 else n
+    carry = acc[0]
+    for start in range(1, n, block):
+        stop = min(n, start + block)
+        powers = alpha ** np.arange(1, stop - start + 1)
+        out[start:stop] = powers[:, None] * (carry + np.cumsum(u[start:stop] / powers[:, None], axis=0))
+        carry = out[stop - 1]
+    return out
+
+
+# ==========================
+# Kalman Filter
+# ==========================
+class AngleKalman:
+    """
+    Two-state (angle, gyro bias) Kalman filter for a single axis.
+    The gyro rate drives the prediction and the accelerometer angle corrects it.
+    """
+
+    def __init__(self, q_angle=0.001, q_bias=0.003, r_measure=0.03):
+        self.q_angle = q_angle
+        self.q_bias = q_bias
+        self.r_measure = r_measure
+        self.angle = None
+        self.bias = 0.0
+        self.p = [[0.0, 0.0], [0.0, 0.0]]
+
+    def update(self, measured_angle, rate, dt):
+        if self.angle is None:
+            self.angle = measured_angle
+            return self.angle
+
+        # Predict
+        self.angle += (rate - self.bias) * dt
+        p = self.p
+        p00 = p[0][0] + dt * (dt * p[1][1] - p[0][1] - p[1][0] + self.q_angle)
+        p01 = p[0][1] - dt * p[1][1]
+        p10 = p[1][0] - dt * p[1][1]
+        p11 = p[1][1] + self.q_bias * dt
+
+        # Correct
+        s = p00 + self.r_measure
+        k0 = p00 / s
+        k1 = p10 / s
+        y = measured_angle - self.angle
+        self.angle += k0 * y
+        self.bias += k1 * y
+        self.p = [[p00 - k0 * p00, p01 - k0 * p01],
+                  [p10 - k1 * p00, p11 - k1 * p01]]
+        return self.angle
+
+    def reset(self):
+        self.angle = None
+        self.bias = 0.0
+        self.p = [[0.0, 0.0], [0.0, 0.0]]
+
+
+class KalmanFilter:
+    """Pitch and roll Kalman filters sharing the ComplementaryFilter interface."""
+
+    def __init__(self, q_angle=0.001, q_bias=0.003, r_measure=0.03, max_dt=MAX_DT):
+        self.pitch_filter = AngleKalman(q_angle, q_bias, r_measure)
+        self.roll_filter = AngleKalman(q_angle, q_bias, r_measure)
+        self.max_dt = max_dt
+        self.pitch = None
+        self.roll = None
+        self.timestamp = None
+
+    def update(self, sample, dt=None):
+        """
+        Feed one ImuSample; returns the fused (pitch, roll). A sample with
+        dt == 0 (the same reading again) is skipped.
+        """
+        if dt is None and self.timestamp is not None:
+            dt = sample.timestamp - self.timestamp
+        if dt == 0 and self.pitch is not None:
+            return self.pitch, self.roll
+        self.timestamp = sample.timestamp
+
+        acc_pitch, acc_roll = accel_angles(sample.ax, sample.ay, sample.az)
+        if dt is None or not 0 < dt <= self.max_dt:
+            self.pitch_filter.reset()
+            self.roll_filter.reset()
+            dt = 0.0
+        self.pitch = self.pitch_filter.update(acc_pitch, -sample.gy, dt)
+        self.roll = self.roll_filter.update(acc_roll, sample.gx, dt)
+        return self.pitch, self.roll
+
+
+def kalman_batch(accel, gyro, dt, q_angle=0.001, q_bias=0.003, r_measure=0.03):
+    """
+    Run the Kalman filter over a recorded log; same arguments and result as
+    complementary_batch(). The accel angles and body rates are computed as
+    whole arrays, but the filter itself is a time-varying recursion, so it
+    steps through the samples once with plain floats.
+    """
+    acc = accel_angles_batch(accel)
+    rates = gyro_rates_batch(gyro)
+    dts = _dt_array(dt, len(acc)).tolist()
+    out = np.empty_like(acc)
+
+    for axis in range(2):
+        kf = AngleKalman(q_angle, q_bias, r_measure)
+        column = out[:, axis]
+        for k, (measured, rate) in enumerate(zip(acc[:, axis].tolist(), rates[:, axis].tolist())):
+            column[k] = kf.update(measured, rate, dts[k])
+    return out
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+from trajectory import JOINT_ORDER, compile_keyframes
+
+# ==========================
+# Compiled Gait Files
+# ==========================
+# A compiled gait is one file: a small header followed by a contiguous
+# (frames x joints) matrix, either float32 joint angles or uint16 servo
+# pulsewidths. load_gait() maps the matrix with numpy.memmap, so a gait is
+# ready as soon as the header is parsed and only the pages actually played
+# are read from disk.
+#
+# Header (little-endian):
+#   magic "GAIT", format version, kind, frames, joints, rate (Hz),
+#   data offset, then the joint names as UTF-8, one per line.
+# The matrix starts at 'data offset', aligned to DATA_ALIGN bytes.
+
+GAIT_MAGIC = b"GAIT"
+GAIT_VERSION = 1
+GAIT_HEADER = struct.Struct("<4sHHIIfI")
+DATA_ALIGN = 64
+
+KIND_ANGLES = 0        # float32 degrees
+KIND_PULSEWIDTHS = 1   # uint16 microseconds
+KIND_DTYPES = {KIND_ANGLES: np.dtype("<f4"), KIND_PULSEWIDTHS: np.dtype("<u2")}
+
+GAIT_EXTENSION = ".gait"
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".gait_cache")
+
+
+class CompiledGait:
+    """A loaded gait: 'frames' is the read-only (N, J) matrix (a memmap when loaded from disk)."""
+
+    def __init__(self, frames, joints, rate, kind, path=None):
+        self.frames = frames
+        self.joints = tuple(joints)
+        self.rate = rate
+        self.kind = kind
+        self.path = path
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def duration(self):
+        return len(self.frames) / self.rate
+
+    def pose(self, index):
+        """Row 'index' as a joint -> value dict."""
+        return dict(zip(self.joints, self.frames[index].tolist()))
+
+
+def save_gait(path, frames, joints, rate, kind=KIND_ANGLES):
+    """Write a gait file; the file appears atomically so readers never see half of it."""
+    if kind not in KIND_DTYPES:
+        raise ValueError(f"unknown gait kind {kind}")
+    frames = np.ascontiguousarray(frames, dtype=KIND_DTYPES[kind])
+    if frames.ndim != 2 or frames.shape[1] != len(joints):
+        raise ValueError(f"expected a (frames, {len(joints)}) matrix, got shape {frames.shape}")
+
+    names = "\n".join(joints).encode()
+    offset = -(-(GAIT_HEADER.size + len(names)) // DATA_ALIGN) * DATA_ALIGN
+    header = GAIT_HEADER.pack(GAIT_MAGIC, GAIT_VERSION, kind, frames.shape[0], frames.shape[1], rate, offset)
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(header + names)
+        f.write(bytes(offset - len(header) - len(names)))
+        f.write(frames.tobytes())
+    os.replace(temporary, path)
+
+
+def load_gait(path):
+    """Map a gait file written by save_gait()."""
+    with open(path, "rb") as f:
+        header = f.read(GAIT_HEADER.size)
+        if len(header) < GAIT_HEADER.size:
+            raise ValueError(f"{path}: truncated gait header")
+        magic, version, kind, count, width, rate, offset = GAIT_HEADER.unpack(header)
+        if magic != GAIT_MAGIC or version != GAIT_VERSION or kind not in KIND_DTYPES:
+            raise ValueError(f"{path}: not a version {GAIT_VERSION} gait file")
+        joints = f.read(offset - GAIT_HEADER.size).rstrip(b"\0").decode().split("\n")
+    if len(joints) != width:
+        raise ValueError(f"{path}: header lists {len(joints)} joints for {width} columns")
+    frames = np.memmap(path, dtype=KIND_DTYPES[kind], mode="r", offset=offset, shape=(count, width))
+    return CompiledGait(frames, joints, rate, kind, path)
+
+
+def gait_key(keyframes, **options):
+    """Content hash of a keyframe list and the options it is compiled with."""
+    content = json.dumps([GAIT_VERSION, keyframes, options], sort_keys=True, default=lambda value: np.asarray(value).tolist())
+    return hashlib.sha256(content.encode()).hexdigest()[:20]
+
+
+def compile_gait(keyframes, segment_time, rate, profile="linear", joints=JOINT_ORDER,
+                 cache_dir=None, calibration=None, **options):
+    """
+    Compiled gait for 'keyframes', from the cache when it was built before.
+
+    Other arguments are those of trajectory.compile_keyframes(). With a
+    calibration.Calibration the matrix holds that calibration's uint16
+    pulsewidths, otherwise float32 angles. The cache directory is
+    'cache_dir', $GAIT_CACHE_DIR or .gait_cache next to this module; any change
+    to the keyframes or options gives a new key, so stale files are never used.
+    """
+    key = gait_key(keyframes, segment_time=segment_time, rate=rate, profile=profile, joints=joints,
+                   calibration=None if calibration is None else calibration.digest(), **options)
+    cache_dir = cache_dir or os.environ.get("GAIT_CACHE_DIR", DEFAULT_CACHE_DIR)
+    path = os.path.join(cache_dir, key + GAIT_EXTENSION)
+    try:
+        return load_gait(path)
+    except (OSError, ValueError):
+        pass
+
+    trajectory = compile_keyframes(keyframes, segment_time, rate, profile, joints, **options)
+    if calibration is not None:
+        frames, kind = trajectory.pulsewidths(calibration), KIND_PULSEWIDTHS
+    else:
+        frames, kind = trajectory.angles, KIND_ANGLES
+    os.makedirs(cache_dir, exist_ok=True)
+    save_gait(path, frames, trajectory.joints, rate, kind)
+    return load_gait(path)
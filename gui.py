@@ -1,29 +1,28 @@
-import pigpio
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
-import time
-import threading
+import itertools
+import queue
+
+from calibration import load_calibration
+from runtime import ControlRuntime
+from hal import open_servo_bus
 
 # ----------------------------
-# 1. PIGPIO INITIALIZATION
+# 1. SERVO BACKEND INITIALIZATION
 # ----------------------------
-pi = pigpio.pi()
-if not pi.connected:
-    print("Failed to connect to pigpio daemon")
+try:
+    servos = open_servo_bus()  # pigpio unless --backend or ROBOT_BACKEND picks pca9685 or sim
+except ConnectionError as e:
+    print(e)
     exit()
 
 # ----------------------------
 # 2. SERVO PINS AND POSITIONS
 # ----------------------------
-servo_pins = {
-    "Hip Left": 23,
-    "Knee Left": 22,
-    "Hip Right": 27,
-    "Knee Right": 17,  # Physically reversed
-    "Left Toe": 16,
-    "Right Toe": 26,   # Physically reversed
-}
+# Angle -> pulsewidth per joint, including Right Toe's reversal (calibration.py)
+servo_pins = servos.servo_pins
+calibration = load_calibration()
 
 natural_standing_position = {
     "Hip Left": 90,
@@ -62,24 +61,18 @@ walking_cycle = [
      "Left Toe": 110, "Right Toe": 110},
 ]
 
-walking = False  # Controls the walking cycle loop
+walker = None  # ControlRuntime stepping through walking_cycle while it runs
+# Angles the walking cycle sent, shown by poll_ui_updates() on the Tk thread
+ui_updates = queue.Queue()
+UI_POLL_MS = 50
 
 # ----------------------------
 # 3. SERVO HELPER FUNCTIONS
 # ----------------------------
-def set_servo_angle(pin, angle, reverse=False):
-    """Move the servo on 'pin' to 'angle'. If reverse=True, invert the angle."""
-    if reverse:
-        angle = 180 - angle
-    pulsewidth = 500 + (angle / 180.0) * 2000
-    pulsewidth = max(500, min(2500, pulsewidth))  # clamp to [500..2500]
-    pi.set_servo_pulsewidth(pin, pulsewidth)
-
 def move_all_servos(angles):
-    """Move each servo to the specified angle; reverse Right Knee and Right Toe."""
+    """Move every servo in one frame."""
+    servos.commit_frame(calibration.frame(angles, servo_pins))  # one round trip per pose, only when it changed
     for joint, angle in angles.items():
-        reverse = (joint == "Right Knee" or joint == "Right Toe")
-        set_servo_angle(servo_pins[joint], angle, reverse)
         print(f"{joint} moved to {angle}°")
 
 def update_text_boxes(angles):
@@ -148,31 +141,46 @@ def reset_to_natural_position():
     move_all_servos(natural_standing_position)
     messagebox.showinfo("Reset", "Robot has been reset to the natural standing position.")
 
-def execute_walking_cycle():
-    """Execute the walking cycle in a loop until 'walking' is set to False."""
-    global walking
-    walking = True
-    while walking:
-        for step in walking_cycle:
-            if not walking:
-                break
-            move_all_servos(step)
-            # Also update text boxes for clarity
-            update_text_boxes(step)
-            time.sleep(0.5)
-    messagebox.showinfo("Cycle Stopped", "The walking cycle has been stopped.")
+def walk_step(step):
+    move_all_servos(step)
+    # Also update text boxes for clarity. This runs on the runtime's servo
+    # thread and Tk may only be touched from its own, so hand the angles over
+    ui_updates.put(step)
+
+def poll_ui_updates():
+    """Show the angles queued by walk_step() in the text boxes."""
+    while True:
+        try:
+            update_text_boxes(ui_updates.get_nowait())
+        except queue.Empty:
+            break
+    root.after(UI_POLL_MS, poll_ui_updates)
 
 def start_cycle():
-    """Start the walking cycle in a separate thread."""
-    global walking
-    if not walking:
-        walking_thread = threading.Thread(target=execute_walking_cycle)
-        walking_thread.start()
+    """Start the walking cycle in the background."""
+    global walker
+    if walker is None:
+        steps = itertools.cycle(walking_cycle)
+        # One step every 0.5 s on a fixed grid, however long the servo writes take
+        walker = ControlRuntime(None, lambda sample: next(steps), walk_step, rate=2)
+        walker.start()
 
 def stop_cycle():
-    """Stop the walking cycle."""
-    global walking
-    walking = False
+    """Stop the walking cycle without blocking the GUI while the last step goes out."""
+    if walker is not None:
+        walker.stop(wait=False)
+        root.after(UI_POLL_MS, finish_stop_cycle)
+
+def finish_stop_cycle():
+    global walker
+    if walker is None:
+        return  # already finished by an earlier click
+    if not walker.finished:
+        root.after(UI_POLL_MS, finish_stop_cycle)
+        return
+    walker.stop()
+    walker = None
+    messagebox.showinfo("Cycle Stopped", "The walking cycle has been stopped.")
 
 # ----------------------------
 # 6. TKINTER GUI SETUP
@@ -249,10 +257,11 @@ update_button.grid(column=0, row=row_index, columnspan=2, pady=10)
 # ----------------------------
 # 8. MAINLOOP AND CLEANUP
 # ----------------------------
+root.after(UI_POLL_MS, poll_ui_updates)
 root.mainloop()
 
-# On close: turn off all servos
-for pin in servo_pins.values():
-    pi.set_servo_pulsewidth(pin, 0)
-pi.stop()
-print("pigpio cleanup complete.")
+# On close: finish the walking cycle, then turn off all servos
+if walker is not None:
+    walker.stop()
+servos.close()
+print("Servo cleanup complete.")
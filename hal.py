@@ -0,0 +1,408 @@
+import argparse
+import math
+import os
+import random
+import time
+
+from mpu6050 import ImuSample
+
+# ==========================
+# Hardware Abstraction Layer
+# ==========================
+# Scripts talk to a ServoBus (pose output) and an ImuSource (MPU6050 samples)
+# instead of creating pigpio.pi() / smbus.SMBus(1) themselves. The backend is
+# picked with --backend on the command line or the ROBOT_BACKEND environment
+# variable:
+#   pigpio   servos on GPIO through the pigpio daemon (default)
+#   pca9685  servos on the PCA9685 board, sharing I2C bus 1 with the
+#            MPU6050 through one i2c_bus.I2CBusManager
+#   sim      in-process servos and a stationary IMU, no hardware needed
+#   biped    biped_sim.BipedSimulator following wall time: the IMU reports
+#            what the simulated robot does with the poses it is sent
+#   broker   servos and IMU shared through a running servo_broker.py, so
+#            several scripts can use the robot at once
+# Every backend records how long each call takes, so loop throughput can be
+# compared between the robot and a dev box.
+#
+# On the MPU6050 backends, --imu-trigger interrupt (or ROBOT_IMU_TRIGGER)
+# reads the sensor on its DATA_RDY interrupt instead of when asked; see
+# InterruptImuSource.
+
+BACKENDS = ("pigpio", "pca9685", "sim", "biped", "broker")
+DEFAULT_BACKEND = "pigpio"
+IMU_TRIGGERS = ("poll", "interrupt")
+DEFAULT_IMU_TRIGGER = "poll"
+
+# GPIO pins used by the pigpio scripts
+PIGPIO_SERVO_PINS = {
+    "Hip Left": 23,
+    "Knee Left": 22,
+    "Hip Right": 27,
+    "Knee Right": 17,
+    "Left Toe": 16,
+    "Right Toe": 26,
+}
+
+# Typical hobby servo: 0.1 s per 60° -> 600 °/s, or about 6700 µs of pulse per second
+SERVO_SLEW_US_PER_S = 600 / 180 * 2000
+
+
+def select_backend(argv=None):
+    """Backend name from --backend NAME in 'argv', else ROBOT_BACKEND, else pigpio."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--backend", choices=BACKENDS)
+    args, _ = parser.parse_known_args(argv)
+    backend = args.backend or os.environ.get("ROBOT_BACKEND", DEFAULT_BACKEND)
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+    return backend
+
+
+def select_imu_trigger(argv=None):
+    """IMU trigger from --imu-trigger NAME in 'argv', else ROBOT_IMU_TRIGGER, else poll."""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--imu-trigger", choices=IMU_TRIGGERS)
+    args, _ = parser.parse_known_args(argv)
+    trigger = args.imu_trigger or os.environ.get("ROBOT_IMU_TRIGGER", DEFAULT_IMU_TRIGGER)
+    if trigger not in IMU_TRIGGERS:
+        raise ValueError(f"unknown IMU trigger {trigger!r}, expected one of {', '.join(IMU_TRIGGERS)}")
+    return trigger
+
+
+class LatencyStats:
+    """Count, mean, max and last duration of a kind of call, in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __repr__(self):
+        return f"{self.count} calls, mean {self.mean * 1e6:.1f}us, max {self.max * 1e6:.1f}us"
+
+
+# ==========================
+# Servo Buses
+# ==========================
+class ServoBus:
+    """
+    Pose output. 'servo_pins' maps joint names to this backend's outputs
+    (GPIO pins, PCA channels, ...); poses are {output: pulsewidth} frames.
+    """
+
+    servo_pins = {}
+    # Modeled transport delay added to every recorded call (simulator only)
+    link_latency = 0.0
+
+    def __init__(self):
+        self.latency = LatencyStats()
+
+    def set_servo_pulsewidth(self, pin, pulsewidth):
+        return self.commit_frame({pin: pulsewidth})
+
+    def commit_frame(self, pulsewidths):
+        """Apply a {pin: pulsewidth} pose. Returns True if anything was sent."""
+        start = time.perf_counter()
+        sent = self._commit(pulsewidths)
+        self.latency.add(time.perf_counter() - start + self.link_latency)
+        return sent
+
+    def off(self):
+        """Stop sending pulses to every servo."""
+        self.commit_frame({pin: 0 for pin in self.servo_pins.values()})
+
+    def close(self):
+        """Turn the servos off and release the hardware."""
+        self.off()
+
+    def _commit(self, pulsewidths):
+        raise NotImplementedError
+
+
+class PigpioServoBus(ServoBus):
+    servo_pins = PIGPIO_SERVO_PINS
+
+    def __init__(self, pi=None, deadband=0):
+        super().__init__()
+        from servo_output import ServoOutput
+        if pi is None:
+            import pigpio
+            pi = pigpio.pi()
+        if not pi.connected:
+            raise ConnectionError("Failed to connect to pigpio daemon")
+        self.pi = pi
+        self.output = ServoOutput(pi, deadband)
+
+    def _commit(self, pulsewidths):
+        return self.output.commit_frame(pulsewidths)
+
+    def close(self):
+        super().close()
+        self.output.close()
+        self.pi.stop()
+
+
+class PCA9685ServoBus(ServoBus):
+    def __init__(self, board=None):
+        super().__init__()
+        from pca9685 import PCA9685, PCA_SERVO_CHANNELS
+        self.servo_pins = dict(PCA_SERVO_CHANNELS)
+        self.board = PCA9685() if board is None else board
+
+    def _commit(self, pulsewidths):
+        return self.board.commit_frame(pulsewidths)
+
+    def close(self):
+        super().close()
+        self.board.close()
+
+
+class SimServoBus(ServoBus):
+    """
+    In-process servos. Each output slews toward its commanded pulsewidth at
+    'slew_rate' µs per second on 'clock', so position() tells where a joint
+    really is, and every call is recorded with 'link_latency' seconds of
+    modeled transport delay on top of the measured Python time.
+    """
+
+    servo_pins = PIGPIO_SERVO_PINS
+
+    def __init__(self, slew_rate=SERVO_SLEW_US_PER_S, link_latency=0.0, clock=time.monotonic):
+        super().__init__()
+        self.slew_rate = slew_rate
+        self.link_latency = link_latency
+        self.clock = clock
+        self.commanded = {}
+        self._moves = {}  # pin -> (start pulsewidth, start time)
+
+    def _commit(self, pulsewidths):
+        now = self.clock()
+        sent = False
+        for pin, pulsewidth in pulsewidths.items():
+            pulsewidth = int(pulsewidth)
+            if self.commanded.get(pin) == pulsewidth:
+                continue
+            self._moves[pin] = (self.position(pin, now), now)
+            self.commanded[pin] = pulsewidth
+            sent = True
+        return sent
+
+    def position(self, pin, now=None):
+        """Current pulsewidth of 'pin' after slewing; 0 if it is off or was never set."""
+        target = self.commanded.get(pin, 0)
+        start, since = self._moves.get(pin, (0, 0.0))
+        if target == 0 or start == 0:
+            return target
+        now = self.clock() if now is None else now
+        travel = self.slew_rate * (now - since)
+        if abs(target - start) <= travel:
+            return target
+        return start + math.copysign(travel, target - start)
+
+    def settle_time(self, now=None):
+        """Seconds until every servo reaches its commanded pulsewidth."""
+        now = self.clock() if now is None else now
+        return max((abs(self.commanded[pin] - self.position(pin, now)) / self.slew_rate
+                    for pin in self.commanded), default=0.0)
+
+
+# ==========================
+# IMU Sources
+# ==========================
+class ImuSource:
+    """
+    Source of ImuSample readings. A 'paced' source's read_sample() waits for
+    the sensor's next sample, so its readers need no timer of their own.
+    """
+
+    # Modeled transport delay added to every recorded read (simulator only)
+    link_latency = 0.0
+    paced = False
+
+    def __init__(self):
+        self.latency = LatencyStats()
+
+    def read_sample(self):
+        start = time.perf_counter()
+        sample = self._read()
+        self.latency.add(time.perf_counter() - start + self.link_latency)
+        return sample
+
+    def close(self):
+        pass
+
+    def _read(self):
+        raise NotImplementedError
+
+
+class MPU6050ImuSource(ImuSource):
+    def __init__(self, mpu=None):
+        super().__init__()
+        from mpu6050 import MPU6050
+        self.mpu = MPU6050() if mpu is None else mpu
+        self.mpu.wake()
+
+    def _read(self):
+        return self.mpu.read_sample()
+
+
+class InterruptImuSource(ImuSource):
+    """
+    MPU6050 samples read on its DATA_RDY interrupt (imu_interrupt.InterruptImu)
+    at 'sample_rate' Hz. read_sample() waits for a sample newer than the last
+    one it returned and returns the newest; 'skipped' counts the older ones it
+    passed over because the reader was slower than the sensor.
+    """
+
+    paced = True
+
+    def __init__(self, mpu=None, pi=None, sample_rate=None, int_gpio=None, timeout=0.1):
+        super().__init__()
+        from imu_interrupt import MPU_INT_GPIO, InterruptImu
+        from mpu6050 import MIN_STREAM_RATE, MPU6050
+        self._own_pi = pi is None
+        if pi is None:
+            import pigpio
+            pi = pigpio.pi()
+        if not pi.connected:
+            raise ConnectionError("Failed to connect to pigpio daemon")
+        self.pi = pi
+        self.mpu = MPU6050() if mpu is None else mpu
+        self.mpu.wake()
+        self.timeout = timeout
+        self.skipped = 0
+        self.interrupts = InterruptImu(pi, self.mpu, MPU_INT_GPIO if int_gpio is None else int_gpio)
+        self.rate = self.interrupts.start(sample_rate or MIN_STREAM_RATE)
+        self.reader = self.interrupts.reader()
+
+    def _read(self):
+        samples = self.interrupts.wait(self.reader, self.timeout)
+        self.skipped += len(samples) - 1
+        return samples[-1]
+
+    def close(self):
+        self.interrupts.stop()
+        if self._own_pi:
+            self.pi.stop()
+
+
+class SimImuSource(ImuSource):
+    """
+    Stationary sensor tilted by 'pitch' and 'roll' degrees (settable at any
+    time) with optional Gaussian noise on every axis.
+    """
+
+    def __init__(self, pitch=0.0, roll=0.0, accel_noise=0.0, gyro_noise=0.0,
+                 link_latency=0.0, clock=time.monotonic, seed=None):
+        super().__init__()
+        self.pitch = pitch
+        self.roll = roll
+        self.accel_noise = accel_noise
+        self.gyro_noise = gyro_noise
+        self.link_latency = link_latency
+        self.clock = clock
+        self.random = random.Random(seed)
+
+    def _read(self):
+        # Gravity in the sensor frame for the fusion.py angle convention
+        pitch, roll = math.radians(self.pitch), math.radians(self.roll)
+        ax = math.sin(pitch)
+        ay = math.cos(pitch) * math.sin(roll)
+        az = math.cos(pitch) * math.cos(roll)
+        g = self.random.gauss
+        a_sd, g_sd = self.accel_noise, self.gyro_noise
+        return ImuSample(
+            self.clock(),
+            ax + g(0, a_sd), ay + g(0, a_sd), az + g(0, a_sd),
+            25.0,
+            g(0, g_sd), g(0, g_sd), g(0, g_sd),
+        )
+
+
+# ==========================
+# Factories
+# ==========================
+_biped = None
+_i2c = None
+
+
+def shared_biped():
+    """The BipedSimulator behind the "biped" backend, shared by its servos and IMU."""
+    global _biped
+    if _biped is None:
+        from biped_sim import BipedSimulator
+        from calibration import load_calibration
+        # Decoded with the calibration the scripts encode their poses with
+        _biped = BipedSimulator(clock=time.monotonic, calibration=load_calibration())
+    return _biped
+
+
+def shared_i2c():
+    """The running i2c_bus.I2CBusManager for bus 1, shared by the PCA9685 and the MPU6050."""
+    global _i2c
+    if _i2c is None:
+        from i2c_bus import I2CBusManager
+        _i2c = I2CBusManager()
+        _i2c.start()
+    return _i2c
+
+
+def open_servo_bus(backend=None, **options):
+    """ServoBus for 'backend' (see select_backend() for the default)."""
+    backend = backend or select_backend()
+    if backend == "pigpio":
+        return PigpioServoBus(**options)
+    if backend == "pca9685":
+        if "board" not in options:
+            from i2c_bus import PRIORITY_CONFIG, PRIORITY_SERVO
+            from pca9685 import PCA9685
+            manager = shared_i2c()
+            options["board"] = PCA9685(bus=manager.proxy(PRIORITY_SERVO), config_bus=manager.proxy(PRIORITY_CONFIG))
+        return PCA9685ServoBus(**options)
+    if backend == "sim":
+        return SimServoBus(**options)
+    if backend == "biped":
+        return shared_biped().servos
+    if backend == "broker":
+        from servo_broker import BrokerServoBus
+        return BrokerServoBus(**options)
+    raise ValueError(f"unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+
+def open_imu(backend=None, trigger=None, **options):
+    """
+    ImuSource for 'backend'; both hardware backends read the MPU6050, when
+    asked or, with trigger "interrupt" (see select_imu_trigger()), on its
+    DATA_RDY interrupt.
+    """
+    backend = backend or select_backend()
+    trigger = trigger or select_imu_trigger()
+    if trigger == "interrupt" and backend not in ("pigpio", "pca9685"):
+        raise ValueError(f"the interrupt IMU trigger needs the MPU6050 (pigpio or pca9685 backend), not {backend!r}")
+    if backend == "pca9685" and "mpu" not in options:
+        from i2c_bus import PRIORITY_CONFIG, PRIORITY_IMU
+        from mpu6050 import MPU6050
+        manager = shared_i2c()
+        options["mpu"] = MPU6050(bus=manager.proxy(PRIORITY_IMU), config_bus=manager.proxy(PRIORITY_CONFIG))
+    if backend in ("pigpio", "pca9685"):
+        return InterruptImuSource(**options) if trigger == "interrupt" else MPU6050ImuSource(**options)
+    if backend == "sim":
+        return SimImuSource(**options)
+    if backend == "biped":
+        return shared_biped().imu
+    if backend == "broker":
+        from servo_broker import BrokerImuSource
+        return BrokerImuSource(**options)
+    raise ValueError(f"unknown backend {backend!r}, expected one of {', '.join(BACKENDS)}")
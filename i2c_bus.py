@@ -0,0 +1,254 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from hal import LatencyStats
+
+# ==========================
+# I2C Bus Manager
+# ==========================
+# The MPU6050 and the PCA9685 share I2C bus 1 (GPIO 2/3). With both running
+# at a high rate nothing stops a burst of servo frames from delaying an IMU
+# read, or two threads from interleaving their transfers. I2CBusManager owns
+# the bus on one thread and runs transactions from three priority lanes:
+#
+#   PRIORITY_IMU     sensor reads, always served first
+#   PRIORITY_SERVO   servo frames
+#   PRIORITY_CONFIG  register setup, only when nothing else is waiting
+#
+# Each device driver gets a BusProxy bound to its data lane, plus one on the
+# config lane for register setup, which it flushes before using the data
+# lane again. A BusProxy looks like an smbus.SMBus. Reads block until their
+# result is back. Writes are queued and return at once; a later call on the
+# same proxy raises any error they hit.
+# A lane runs in order, so a read always sees the writes issued before it.
+# Queued writes to consecutive registers of the same device are merged into
+# one block write. Both drivers turn on register auto-increment, which this
+# needs.
+
+PRIORITY_IMU = 0
+PRIORITY_SERVO = 1
+PRIORITY_CONFIG = 2
+PRIORITY_NAMES = ("imu", "servo", "config")
+
+# smbus block transfers are limited to 32 bytes
+I2C_BLOCK_MAX = 32
+# Queued writes a proxy may have outstanding before a write blocks, so a fast
+# writer cannot pile up a backlog of stale frames
+MAX_PENDING_WRITES = 4
+
+
+def open_bus(bus_number=1):
+    """smbus2 when installed, else smbus (the same choice as pca9685.py)."""
+    from pca9685 import open_bus as open_smbus
+    return open_smbus(bus_number)
+
+
+class _Transaction:
+    def __init__(self, method, address, register=None, data=None, args=()):
+        self.method = method
+        self.address = address
+        self.register = register
+        self.data = data      # bytes for mergeable register writes
+        self.args = args
+        self.future = Future()
+        self.queued = time.perf_counter()
+        self.parts = (self,)  # the queued writes a merged write stands for
+
+    @property
+    def mergeable(self):
+        return self.data is not None
+
+
+class I2CBusManager:
+    """
+    Owner of one I2C bus:
+
+        manager = I2CBusManager()          # opens bus 1
+        manager.start()
+        mpu = MPU6050(bus=manager.proxy(PRIORITY_IMU), config_bus=manager.proxy(PRIORITY_CONFIG))
+        board = PCA9685(bus=manager.proxy(PRIORITY_SERVO), config_bus=manager.proxy(PRIORITY_CONFIG))
+        ...
+        print(manager.report())
+        manager.stop()
+
+    'wait' records, per lane, the time from queueing a transaction to it
+    starting on the bus; utilization() is the busy fraction of the bus.
+    """
+
+    def __init__(self, bus=None, bus_number=1, merge=True, clock=time.perf_counter):
+        self.bus = open_bus(bus_number) if bus is None else bus
+        self.merge = merge
+        self.clock = clock
+        self.lanes = [deque() for _ in PRIORITY_NAMES]
+        self.wait = [LatencyStats() for _ in PRIORITY_NAMES]
+        self.transactions = [0] * len(PRIORITY_NAMES)
+        self.merged_writes = 0
+        self.busy_time = 0.0
+        self.started = None
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self.started = self.clock()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="i2c-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Finish every queued transaction, then stop the bus thread."""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, priority, method, address, *args):
+        """Queue bus.method(address, *args) on a lane; returns a Future for the result."""
+        if not 0 <= priority < len(self.lanes):
+            raise ValueError(f"priority must be 0..{len(self.lanes) - 1}, got {priority}")
+        if method == "write_byte_data":
+            transaction = _Transaction(method, address, args[0], bytes((args[1],)))
+        elif method == "write_i2c_block_data":
+            transaction = _Transaction(method, address, args[0], bytes(args[1]))
+        else:
+            transaction = _Transaction(method, address, args=args)
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("the I2C bus manager is not running")
+            self.lanes[priority].append(transaction)
+            self._condition.notify()
+        return transaction.future
+
+    def proxy(self, priority):
+        return BusProxy(self, priority)
+
+    def utilization(self):
+        """Fraction of the time since start() the bus spent in transfers."""
+        elapsed = self.clock() - self.started if self.started is not None else 0.0
+        return self.busy_time / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        lanes = ", ".join(f"{name}: {count} (wait {wait})"
+                          for name, count, wait in zip(PRIORITY_NAMES, self.transactions, self.wait))
+        return (f"bus {self.utilization() * 100:.1f}% busy, {sum(self.transactions)} transactions, "
+                f"{self.merged_writes} writes merged\n    {lanes}")
+
+    # ----- bus thread -----
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not any(self.lanes):
+                    self._condition.wait()
+                lane = next((priority for priority, queue in enumerate(self.lanes) if queue), None)
+                if lane is None:
+                    return
+                transaction = self._take(self.lanes[lane])
+            self._execute(lane, transaction)
+
+    def _take(self, queue):
+        """Pop the next transaction, folding following writes to the next registers into it."""
+        transaction = queue.popleft()
+        if not (self.merge and transaction.mergeable):
+            return transaction
+        merged = [transaction]
+        data = transaction.data
+        while queue and queue[0].mergeable and queue[0].address == transaction.address:
+            following = queue[0]
+            if following.register != transaction.register + len(data) or len(data) + len(following.data) > I2C_BLOCK_MAX:
+                break
+            queue.popleft()
+            merged.append(following)
+            data += following.data
+        if len(merged) == 1:
+            return transaction
+        self.merged_writes += len(merged) - 1
+        combined = _Transaction("write_i2c_block_data", transaction.address, transaction.register, data)
+        combined.queued = transaction.queued
+        combined.parts = merged
+        return combined
+
+    def _execute(self, lane, transaction):
+        start = self.clock()
+        self.wait[lane].add(time.perf_counter() - transaction.queued)
+        try:
+            if transaction.mergeable:
+                if len(transaction.data) == 1:
+                    result = self.bus.write_byte_data(transaction.address, transaction.register, transaction.data[0])
+                else:
+                    result = self.bus.write_i2c_block_data(transaction.address, transaction.register,
+                                                           list(transaction.data))
+            elif transaction.address is None:
+                result = getattr(self.bus, transaction.method)(*transaction.args)
+            else:
+                result = getattr(self.bus, transaction.method)(transaction.address, *transaction.args)
+        except Exception as error:
+            for part in transaction.parts:
+                part.future.set_exception(error)
+        else:
+            for part in transaction.parts:
+                part.future.set_result(result)
+        finally:
+            self.busy_time += self.clock() - start
+            self.transactions[lane] += 1
+
+
+class BusProxy:
+    """smbus.SMBus look-alike that sends everything through an I2CBusManager lane."""
+
+    def __init__(self, manager, priority, max_pending=MAX_PENDING_WRITES):
+        self.manager = manager
+        self.priority = priority
+        self.max_pending = max_pending
+        self._pending = []
+        if hasattr(manager.bus, "i2c_rdwr"):
+            self.i2c_rdwr = self._i2c_rdwr
+
+    def _call(self, method, address, *args):
+        self._raise_pending()
+        return self.manager.submit(self.priority, method, address, *args).result()
+
+    def _post(self, method, address, *args):
+        self._raise_pending()
+        if len(self._pending) >= self.max_pending:
+            self._pending.pop(0).result()
+        self._pending.append(self.manager.submit(self.priority, method, address, *args))
+
+    def _raise_pending(self):
+        # Errors of queued writes surface on the next call
+        done = [future for future in self._pending if future.done()]
+        if done:
+            self._pending = [future for future in self._pending if not future.done()]
+            for future in done:
+                future.result()
+
+    def flush(self):
+        """Wait for this proxy's queued writes."""
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def read_byte_data(self, address, register):
+        return self._call("read_byte_data", address, register)
+
+    def read_i2c_block_data(self, address, register, length):
+        return self._call("read_i2c_block_data", address, register, length)
+
+    def write_byte_data(self, address, register, value):
+        self._post("write_byte_data", address, register, value)
+
+    def write_i2c_block_data(self, address, register, data):
+        self._post("write_i2c_block_data", address, register, list(data))
+
+    def _i2c_rdwr(self, *messages):
+        return self._call("i2c_rdwr", None, *messages)
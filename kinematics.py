@@ -0,0 +1,168 @@
+from functools import lru_cache
+
+import numpy as np
+
+from trajectory import JOINT_ORDER
+
+# ==========================
+# Leg Kinematics
+# ==========================
+# Geometry of the hip-knee-toe legs and the conversions between servo
+# degrees and foot positions. Each leg is a planar chain in the sagittal
+# plane: thigh and shin from the hip servo, then the foot pivoting at the ankle
+# (the "toe" servo). Frames: x forward, y left, z up, origin between the
+# hips; a foot position is the point of the sole under the ankle.
+#
+# Everything takes NumPy arrays, so a whole foot trajectory is solved in one
+# call; solve_pose() adds an LRU cache for poses that are asked for repeatedly.
+
+# Link lengths in metres (approximate, measure the printed frame to refine)
+THIGH_LENGTH = 0.07
+SHIN_LENGTH = 0.07
+ANKLE_HEIGHT = 0.02
+TOE_LENGTH = 0.06    # ankle to toe tip
+HEEL_LENGTH = 0.03   # ankle to heel
+FOOT_WIDTH = 0.04
+HIP_HALF_WIDTH = 0.035
+
+# Joint angles are measured from natural_standing_position, where the legs are
+# straight and the feet flat. Sign turns a servo angle change into hip
+# flexion (leg forward), knee flexion and ankle dorsiflexion respectively.
+NATURAL_STANDING_POSITION = {
+    "Hip Left": 90,
+    "Knee Left": 120,
+    "Hip Right": 90,
+    "Knee Right": 60,
+    "Left Toe": 110,
+    "Right Toe": 110,
+}
+LEGS = {
+    # side: (y of hip, (hip joint, sign), (knee joint, sign), (toe joint, sign))
+    "Left": (HIP_HALF_WIDTH, ("Hip Left", -1), ("Knee Left", 1), ("Left Toe", 1)),
+    "Right": (-HIP_HALF_WIDTH, ("Hip Right", -1), ("Knee Right", -1), ("Right Toe", 1)),
+}
+
+# Foot position of the natural standing pose, relative to its hip
+STANDING_FOOT_HEIGHT = -(THIGH_LENGTH + SHIN_LENGTH + ANKLE_HEIGHT)
+
+# Servo travel; solutions outside it (by more than rounding) are unreachable
+SERVO_MIN_ANGLE = 0.0
+SERVO_MAX_ANGLE = 180.0
+ANGLE_TOLERANCE = 1e-6
+
+IK_CACHE_SIZE = 4096
+IK_CACHE_RESOLUTION = 1e-4  # metres / radians that solve_pose() rounds targets to
+
+
+def servo_to_leg(side, angles):
+    """(hip, knee, ankle) in radians for 'side' from a joint -> servo degrees mapping."""
+    _, *joints = LEGS[side]
+    return tuple(np.radians(sign * (np.asarray(angles[joint], dtype=float) - NATURAL_STANDING_POSITION[joint]))
+                 for joint, sign in joints)
+
+
+def leg_to_servo(side, hip, knee, ankle):
+    """Joint -> servo degrees for 'side' from leg angles in radians."""
+    _, *joints = LEGS[side]
+    return {joint: NATURAL_STANDING_POSITION[joint] + sign * np.degrees(value)
+            for (joint, sign), value in zip(joints, (hip, knee, ankle))}
+
+
+def leg_points(hip, knee, ankle):
+    """
+    Sagittal chain for one leg from joint angles in radians (scalars or arrays).
+    Returns knee, ankle, toe and heel (x, z) points and the foot pitch.
+    """
+    shin = hip - knee
+    foot = shin + ankle
+    knee_x, knee_z = THIGH_LENGTH * np.sin(hip), -THIGH_LENGTH * np.cos(hip)
+    ankle_x, ankle_z = knee_x + SHIN_LENGTH * np.sin(shin), knee_z - SHIN_LENGTH * np.cos(shin)
+    cos_f, sin_f = np.cos(foot), np.sin(foot)
+    sole_x, sole_z = ankle_x + ANKLE_HEIGHT * sin_f, ankle_z - ANKLE_HEIGHT * cos_f
+    toe = (sole_x + TOE_LENGTH * cos_f, sole_z + TOE_LENGTH * sin_f)
+    heel = (sole_x - HEEL_LENGTH * cos_f, sole_z - HEEL_LENGTH * sin_f)
+    return (knee_x, knee_z), (ankle_x, ankle_z), toe, heel, foot
+
+
+def foot_position(hip, knee, ankle):
+    """Forward kinematics: (x, z) of the sole under the ankle and the foot pitch."""
+    _, (ankle_x, ankle_z), _, _, foot = leg_points(hip, knee, ankle)
+    return ankle_x + ANKLE_HEIGHT * np.sin(foot), ankle_z - ANKLE_HEIGHT * np.cos(foot), foot
+
+
+def solve_leg(x, z, foot_pitch=0.0):
+    """
+    Inverse kinematics for one leg, vectorized over any array shape.
+
+    x, z: foot position relative to the hip in metres; foot_pitch: sole
+    angle in radians (0 = flat, positive toes up). Returns (hip, knee, ankle)
+    in radians and a boolean 'reachable' array; out-of-reach targets are
+    solved for the nearest point on the leg's reach (straight or fully folded knee).
+    The knee always bends forward, like the natural pose.
+    """
+    x, z, foot_pitch = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (x, z, foot_pitch)))
+    ankle_x = x - ANKLE_HEIGHT * np.sin(foot_pitch)
+    ankle_z = z + ANKLE_HEIGHT * np.cos(foot_pitch)
+    reach_sq = ankle_x ** 2 + ankle_z ** 2
+    cos_knee = (reach_sq - THIGH_LENGTH ** 2 - SHIN_LENGTH ** 2) / (2 * THIGH_LENGTH * SHIN_LENGTH)
+    reachable = np.abs(cos_knee) <= 1.0
+    knee = np.arccos(np.clip(cos_knee, -1.0, 1.0))
+    hip = np.arctan2(ankle_x, -ankle_z) + np.arctan2(SHIN_LENGTH * np.sin(knee), THIGH_LENGTH + SHIN_LENGTH * np.cos(knee))
+    ankle = foot_pitch - (hip - knee)
+    return hip, knee, ankle, reachable
+
+
+def solve_pose_batch(left, right, foot_pitch=0.0, calibration=None):
+    """
+    Servo angles for whole foot trajectories.
+
+    left, right: (N, 2) arrays of (x, z) foot positions relative to each hip;
+    foot_pitch: scalar, (N,) or {"Left": ..., "Right": ...}. Returns an
+    (N, 6) array of servo degrees in trajectory.JOINT_ORDER (ready for
+    trajectory.Trajectory / Calibration.pulsewidths) and an (N,) reachable mask.
+    A pose is reachable when both legs can reach their feet and every angle
+    is within the servo range: 0-180°, or the safe limits of 'calibration'
+    (a calibration.Calibration) when given.
+    """
+    columns = {}
+    reachable = True
+    for side, feet in (("Left", left), ("Right", right)):
+        feet = np.asarray(feet, dtype=float)
+        pitch = foot_pitch[side] if isinstance(foot_pitch, dict) else foot_pitch
+        hip, knee, ankle, ok = solve_leg(feet[..., 0], feet[..., 1], pitch)
+        columns.update(leg_to_servo(side, hip, knee, ankle))
+        reachable = reachable & ok
+    for joint in JOINT_ORDER:
+        if calibration is None:
+            low, high = SERVO_MIN_ANGLE, SERVO_MAX_ANGLE
+        else:
+            low, high = calibration.joints[joint].min_angle, calibration.joints[joint].max_angle
+        reachable = reachable & (columns[joint] >= low - ANGLE_TOLERANCE) & (columns[joint] <= high + ANGLE_TOLERANCE)
+    return np.stack([columns[joint] for joint in JOINT_ORDER], axis=-1), reachable
+
+
+def solve_pose(left, right, foot_pitch=0.0):
+    """
+    Joint -> servo degrees dict for one pair of (x, z) foot positions, memoized.
+    Raises ValueError if either foot is out of reach or a servo would have
+    to go outside 0-180°.
+    """
+    def quantize(value):
+        return round(float(value) / IK_CACHE_RESOLUTION)
+    angles = _solve_pose_cached(quantize(left[0]), quantize(left[1]),
+                                quantize(right[0]), quantize(right[1]), quantize(foot_pitch))
+    if angles is None:
+        raise ValueError(f"foot positions {tuple(left)}, {tuple(right)} are out of reach or outside the servo range")
+    return dict(zip(JOINT_ORDER, angles))
+
+
+@lru_cache(maxsize=IK_CACHE_SIZE)
+def _solve_pose_cached(left_x, left_z, right_x, right_z, foot_pitch):
+    step = IK_CACHE_RESOLUTION
+    angles, reachable = solve_pose_batch([left_x * step, left_z * step], [right_x * step, right_z * step],
+                                         foot_pitch * step)
+    return tuple(angles.tolist()) if reachable else None
+
+
+def solve_pose_cache_info():
+    return _solve_pose_cached.cache_info()
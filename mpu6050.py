@@ -0,0 +1,209 @@
+import struct
+import time
+from collections import namedtuple
+
+# ==========================
+# MPU6050 Registers
+# ==========================
+MPU6050_ADDR = 0x68
+SMPLRT_DIV = 0x19
+CONFIG = 0x1A
+FIFO_EN = 0x23
+INT_PIN_CFG = 0x37
+INT_ENABLE = 0x38
+INT_STATUS = 0x3A
+ACCEL_XOUT_H = 0x3B
+TEMP_OUT_H = 0x41
+GYRO_XOUT_H = 0x43
+USER_CTRL = 0x6A
+PWR_MGMT_1 = 0x6B
+FIFO_COUNTH = 0x72
+FIFO_R_W = 0x74
+
+# Register bits
+FIFO_EN_ACCEL_GYRO = 0x78  # XG, YG, ZG and ACCEL into the FIFO
+USER_CTRL_FIFO_EN = 0x40
+USER_CTRL_FIFO_RESET = 0x04
+INT_FIFO_OFLOW = 0x10
+INT_DATA_RDY = 0x01
+
+# ACCEL_XOUT_H..GYRO_ZOUT_L: 3 accel words, 1 temperature word, 3 gyro words
+SENSOR_BLOCK_LEN = 14
+SENSOR_BLOCK_FORMAT = ">7h"
+
+# FIFO frames hold 3 accel words then 3 gyro words (no temperature)
+FIFO_FRAME_LEN = 12
+FIFO_FRAME_FORMAT = ">6h"
+FIFO_SIZE = 1024
+
+# smbus block reads are limited to 32 bytes per transaction
+I2C_BLOCK_MAX = 32
+
+# Sample rate limits for streaming, and the gyro output rate SMPLRT_DIV
+# divides down (8 kHz with the DLPF off, 1 kHz with it on)
+MIN_STREAM_RATE = 200
+MAX_STREAM_RATE = 1000
+DLPF_CFG_DEFAULT = 2  # 94 Hz accel / 98 Hz gyro bandwidth
+
+# Default full-scale ranges (+/-2 g, +/-250 °/s)
+ACCEL_SCALE = 16384.0  # LSB per g
+GYRO_SCALE = 131.0     # LSB per °/s
+
+# One accel+gyro reading, in g, °C and °/s, stamped with time.monotonic()
+ImuSample = namedtuple("ImuSample", ["timestamp", "ax", "ay", "az", "temp", "gx", "gy", "gz"])
+
+
+class MPU6050:
+    """
+    Driver for the MPU6050 on I2C bus 1.
+
+    A full sample is fetched as one 14-byte block read starting at
+    ACCEL_XOUT_H instead of two read_byte_data calls per axis. For dense
+    data, stream() runs the sensor off its FIFO at 200 Hz to 1 kHz.
+    Register setup goes over 'config_bus' when given (an i2c_bus.BusProxy on
+    the config lane, say) and over 'bus' otherwise; reads and FIFO resets
+    always use 'bus'.
+    """
+
+    def __init__(self, bus=None, address=MPU6050_ADDR, config_bus=None):
+        if bus is None:
+            import smbus
+            bus = smbus.SMBus(1)  # I2C bus 1 on Raspberry Pi
+        self.bus = bus
+        self.config_bus = bus if config_bus is None else config_bus
+        self.address = address
+        self.sample_rate = None
+        self.fifo_overflows = 0
+
+    def wake(self):
+        """Clear the sleep bit so the sensor starts converting."""
+        self.config_bus.write_byte_data(self.address, PWR_MGMT_1, 0)
+        self._flush_config()
+
+    def set_sample_rate(self, sample_rate=MIN_STREAM_RATE, dlpf_cfg=DLPF_CFG_DEFAULT):
+        """
+        Set SMPLRT_DIV and the DLPF for 'sample_rate' Hz.
+        Returns the rate the divider really gives.
+        """
+        if not MIN_STREAM_RATE <= sample_rate <= MAX_STREAM_RATE:
+            raise ValueError(f"sample_rate must be {MIN_STREAM_RATE}..{MAX_STREAM_RATE} Hz, got {sample_rate}")
+        if not 0 <= dlpf_cfg <= 6:
+            raise ValueError(f"dlpf_cfg must be 0..6, got {dlpf_cfg}")
+        gyro_rate = 8000 if dlpf_cfg == 0 else 1000
+        divider = max(0, round(gyro_rate / sample_rate) - 1)
+
+        self.config_bus.write_byte_data(self.address, CONFIG, dlpf_cfg)
+        self.config_bus.write_byte_data(self.address, SMPLRT_DIV, divider)
+        self._flush_config()
+        self.sample_rate = gyro_rate / (divider + 1)
+        return self.sample_rate
+
+    def configure_stream(self, sample_rate=MIN_STREAM_RATE, dlpf_cfg=DLPF_CFG_DEFAULT):
+        """
+        Set the sample rate and route accel and gyro into a freshly reset FIFO.
+        Returns the rate the divider really gives.
+        """
+        rate = self.set_sample_rate(sample_rate, dlpf_cfg)
+        self.config_bus.write_byte_data(self.address, INT_ENABLE, INT_FIFO_OFLOW)
+        self.config_bus.write_byte_data(self.address, FIFO_EN, FIFO_EN_ACCEL_GYRO)
+        self._flush_config()
+        self.reset_fifo()
+        return rate
+
+    def enable_data_ready_interrupt(self):
+        """Pulse the INT pin (active high, push-pull) each time a new sample is ready."""
+        self.config_bus.write_byte_data(self.address, INT_PIN_CFG, 0)
+        self.config_bus.write_byte_data(self.address, INT_ENABLE, INT_DATA_RDY)
+        self._flush_config()
+
+    def disable_interrupts(self):
+        self.config_bus.write_byte_data(self.address, INT_ENABLE, 0)
+        self._flush_config()
+
+    def reset_fifo(self):
+        """Throw away whatever is queued and restart the FIFO."""
+        self.bus.write_byte_data(self.address, USER_CTRL, USER_CTRL_FIFO_RESET)
+        self.bus.write_byte_data(self.address, USER_CTRL, USER_CTRL_FIFO_EN)
+
+    def stop_stream(self):
+        """Stop filling the FIFO."""
+        self.config_bus.write_byte_data(self.address, FIFO_EN, 0)
+        self.config_bus.write_byte_data(self.address, USER_CTRL, 0)
+        self._flush_config()
+
+    def _flush_config(self):
+        # Setup queued on an i2c_bus.BusProxy must land before the next read on 'bus'
+        flush = getattr(self.config_bus, "flush", None)
+        if flush is not None:
+            flush()
+
+    def fifo_count(self):
+        """Number of bytes currently queued in the FIFO."""
+        high, low = self.bus.read_i2c_block_data(self.address, FIFO_COUNTH, 2)
+        return (high << 8) | low
+
+    def fifo_overflowed(self):
+        """True if the FIFO overflowed since the last check (reading clears the flag)."""
+        return bool(self.bus.read_byte_data(self.address, INT_STATUS) & INT_FIFO_OFLOW)
+
+    def read_fifo_raw(self):
+        """
+        Drain every complete frame from the FIFO with block reads.
+        Returns a list of (ax, ay, az, gx, gy, gz) count tuples.
+        """
+        count = self.fifo_count()
+        count -= count % FIFO_FRAME_LEN
+        data = bytearray()
+        while len(data) < count:
+            chunk = min(I2C_BLOCK_MAX, count - len(data))
+            data += bytes(self.bus.read_i2c_block_data(self.address, FIFO_R_W, chunk))
+        return list(struct.iter_unpack(FIFO_FRAME_FORMAT, data))
+
+    def stream(self, sample_rate=MIN_STREAM_RATE, dlpf_cfg=DLPF_CFG_DEFAULT, poll_interval=0.01):
+        """
+        Generator yielding ImuSample at a fixed rate from the on-chip FIFO.
+
+        The FIFO is drained in bulk every 'poll_interval' seconds, and each
+        sample is stamped by counting back one period from the drain time.
+        If the FIFO overflowed, frame alignment is lost, so it is reset and
+        'fifo_overflows' is incremented. The temperature field is None because
+        the FIFO does not carry it.
+        """
+        period = 1.0 / self.configure_stream(sample_rate, dlpf_cfg)
+        self.fifo_overflows = 0
+        try:
+            while True:
+                if self.fifo_overflowed() or self.fifo_count() >= FIFO_SIZE:
+                    self.fifo_overflows += 1
+                    self.reset_fifo()
+                    time.sleep(poll_interval)
+                    continue
+
+                frames = self.read_fifo_raw()
+                drained_at = time.monotonic()
+                last = len(frames) - 1
+                for i, (ax, ay, az, gx, gy, gz) in enumerate(frames):
+                    yield ImuSample(
+                        drained_at - (last - i) * period,
+                        ax / ACCEL_SCALE, ay / ACCEL_SCALE, az / ACCEL_SCALE,
+                        None,
+                        gx / GYRO_SCALE, gy / GYRO_SCALE, gz / GYRO_SCALE,
+                    )
+                time.sleep(poll_interval)
+        finally:
+            self.stop_stream()
+
+    def read_raw(self):
+        """Return (ax, ay, az, temp, gx, gy, gz) as signed 16-bit counts."""
+        data = self.bus.read_i2c_block_data(self.address, ACCEL_XOUT_H, SENSOR_BLOCK_LEN)
+        return struct.unpack(SENSOR_BLOCK_FORMAT, bytes(data))
+
+    def read_sample(self):
+        """Read accel, temperature and gyro in one transaction and scale them."""
+        ax, ay, az, temp, gx, gy, gz = self.read_raw()
+        return ImuSample(
+            time.monotonic(),
+            ax / ACCEL_SCALE, ay / ACCEL_SCALE, az / ACCEL_SCALE,
+            temp / 340.0 + 36.53,
+            gx / GYRO_SCALE, gy / GYRO_SCALE, gz / GYRO_SCALE,
+        )
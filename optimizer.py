@@ -0,0 +1,256 @@
+import math
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from trajectory import JOINT_ORDER
+
+# ==========================
+# Pattern Optimizer
+# ==========================
+# Population search over the movement_pattern of cycle_mpu.py. A candidate is
+# the base pattern plus a vector of per-step, per-joint offsets in degrees.
+# CMA-ES proposes a generation of offset vectors, every candidate is scored
+# on its own BipedSimulator in a process pool (after the microsecond static
+# check in stability.py), and only the best few are then tried on the robot
+# with validate_on_hardware().
+#
+# Scores are mean |pitch| + |roll| in degrees, lower is better. On the robot
+# (validate_on_hardware) that is cycle_mpu.py's measurement after the
+# pattern. The simulated robot settles perfectly once it is back in
+# base_position, so in simulation the tilt is averaged over the hold after
+# every step instead.
+
+MAX_OFFSET = 15          # degrees any joint may move from the starting pattern
+INITIAL_SIGMA = 3.0      # degrees, initial search step
+FALL_SCORE = 180.0       # score of a candidate that tips the robot over
+MIN_SUPPORT_MARGIN = 0.005
+SIM_SOURCE = "biped-sim"  # experiment_store source name of simulated scores; not a hal backend name
+
+Candidate = namedtuple("Candidate", "score pitch_dev roll_dev pattern")
+
+
+def pattern_from_offsets(pattern, offsets, max_offset=MAX_OFFSET):
+    """'pattern' (a list of joint -> angle dicts) with 'offsets' added in JOINT_ORDER, clamped to 0..180."""
+    offsets = np.clip(np.asarray(offsets, dtype=float).reshape(len(pattern), len(JOINT_ORDER)),
+                      -max_offset, max_offset)
+    return [{joint: float(min(180, max(0, step[joint] + offset))) for joint, offset in zip(JOINT_ORDER, row)}
+            for step, row in zip(pattern, offsets)]
+
+
+def evaluate_pattern(pattern, base_position, min_margin=MIN_SUPPORT_MARGIN):
+    """Score one pattern on a fresh simulated robot. Returns a Candidate."""
+    from biped_sim import BipedSimulator
+    from stability import check_pattern
+
+    stable, _, _ = check_pattern(pattern, base_position, min_margin)
+    if not stable:
+        return Candidate(FALL_SCORE, FALL_SCORE, 0.0, pattern)
+    sim = BipedSimulator()
+    sim.reset(base_position)
+    pitch_dev = roll_dev = 0.0
+    steps = list(pattern) + [base_position]
+    for step in steps:
+        sim.move_all_servos(step)
+        # Sampled over the 0.5 s hold of cycle_mpu.py's execute_pattern()
+        step_pitch, step_roll = sim.measure_stability()
+        if sim.fallen:
+            return Candidate(FALL_SCORE, FALL_SCORE, 0.0, pattern)
+        pitch_dev += step_pitch / len(steps)
+        roll_dev += step_roll / len(steps)
+    return Candidate(pitch_dev + roll_dev, pitch_dev, roll_dev, pattern)
+
+
+def _evaluate(job):
+    pattern, base_position, min_margin = job
+    return evaluate_pattern(pattern, base_position, min_margin)
+
+
+def _pool_context():
+    # spawn/forkserver re-run the calling script in every worker, and the
+    # scripts open the servos at import time, so fork wherever it exists
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def start_pool(workers=None):
+    """
+    Process pool for PatternOptimizer(executor=...) with its workers already
+    running. The workers are forked, and forking a process that has other
+    threads can deadlock in the child, so call this before opening the
+    hardware or starting any threads.
+    """
+    executor = ProcessPoolExecutor(workers or os.cpu_count(), mp_context=_pool_context())
+    # The first job makes a fork-context pool start all of its workers
+    executor.submit(int).result()
+    return executor
+
+
+class CMAES:
+    """
+    Minimal (mu/mu_w, lambda) CMA-ES minimizer with the default parameters
+    from Hansen's tutorial. ask() returns a (population, n) array, tell()
+    takes the scores of those rows.
+    """
+
+    def __init__(self, x0, sigma, population=None, seed=None):
+        self.mean = np.asarray(x0, dtype=float).copy()
+        n = self.n = len(self.mean)
+        self.sigma = sigma
+        self.population = population or 4 + int(3 * math.log(n))
+        self.mu = self.population // 2
+        weights = math.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1.0 / np.sum(self.weights ** 2)
+
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+        self.damps = 1 + 2 * max(0.0, math.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n * n))
+
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.C = np.eye(n)
+        self.B = np.eye(n)
+        self.D = np.ones(n)
+        self.generation = 0
+        self.random = np.random.default_rng(seed)
+
+    def ask(self):
+        z = self.random.standard_normal((self.population, self.n))
+        return self.mean + self.sigma * (z * self.D) @ self.B.T
+
+    def tell(self, solutions, scores):
+        order = np.argsort(scores)[:self.mu]
+        y = (np.asarray(solutions)[order] - self.mean) / self.sigma
+        step = self.weights @ y
+        self.mean = self.mean + self.sigma * step
+        self.generation += 1
+
+        inv_sqrt_c = self.B @ np.diag(1 / self.D) @ self.B.T
+        self.ps = (1 - self.cs) * self.ps + math.sqrt(self.cs * (2 - self.cs) * self.mueff) * inv_sqrt_c @ step
+        ps_norm = np.linalg.norm(self.ps)
+        hsig = ps_norm / math.sqrt(1 - (1 - self.cs) ** (2 * self.generation)) / self.chi_n < 1.4 + 2 / (self.n + 1)
+        self.pc = (1 - self.cc) * self.pc + hsig * math.sqrt(self.cc * (2 - self.cc) * self.mueff) * step
+
+        rank_mu = (y * self.weights[:, None]).T @ y
+        self.C = ((1 - self.c1 - self.cmu) * self.C
+                  + self.c1 * (np.outer(self.pc, self.pc) + (1 - hsig) * self.cc * (2 - self.cc) * self.C)
+                  + self.cmu * rank_mu)
+        self.sigma *= math.exp(self.cs / self.damps * (ps_norm / self.chi_n - 1))
+
+        eigenvalues, self.B = np.linalg.eigh((self.C + self.C.T) / 2)
+        self.D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+
+
+class PatternOptimizer:
+    """
+    CMA-ES over the offsets of 'pattern' (a cycle_mpu.py movement_pattern),
+    scored in parallel on simulated robots:
+
+        with PatternOptimizer(movement_pattern, base_position) as optimizer:
+            optimizer.run(generations=30)
+            best = optimizer.top(3)
+
+    With an experiment_store.ExperimentStore, patterns already simulated
+    within its TTL are not simulated again, and the search starts from the
+    best stored pattern for this base position when it beats 'pattern'.
+
+    Without an 'executor' it starts its own process pool on the first
+    generation. A process that already runs threads (hardware, IMU sampling)
+    should pass one from start_pool() instead, started before those threads.
+    """
+
+    def __init__(self, pattern, base_position, sigma=INITIAL_SIGMA, population=None, max_offset=MAX_OFFSET,
+                 workers=None, seed=None, min_margin=MIN_SUPPORT_MARGIN, store=None, executor=None):
+        self.pattern = [dict(step) for step in pattern]
+        self.base_position = dict(base_position)
+        self.store = store
+        if store is not None:
+            known = store.best(self.base_position, SIM_SOURCE)
+            if known and len(known[0].pattern) == len(self.pattern):
+                start = store.lookup(self.pattern, self.base_position, SIM_SOURCE)
+                if start is None or known[0].score < start.score:
+                    self.pattern = known[0].pattern
+        self.max_offset = max_offset
+        self.min_margin = min_margin
+        self.search = CMAES(np.zeros(len(pattern) * len(JOINT_ORDER)), sigma, population, seed)
+        self.results = []
+        self.evaluations = 0
+        self.workers = workers or os.cpu_count()
+        self._own_executor = executor is None
+        self._executor = ProcessPoolExecutor(self.workers, mp_context=_pool_context()) if executor is None else executor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._own_executor:
+            self._executor.shutdown()
+
+    def evaluate(self, patterns):
+        """Score a list of patterns in parallel; returns Candidates in the same order."""
+        candidates = [None] * len(patterns)
+        if self.store is not None:
+            for index, pattern in enumerate(patterns):
+                candidates[index] = self.store.lookup(pattern, self.base_position, SIM_SOURCE)
+        missing = [index for index, candidate in enumerate(candidates) if candidate is None]
+
+        jobs = [(patterns[index], self.base_position, self.min_margin) for index in missing]
+        chunk = max(1, len(jobs) // (4 * self.workers))
+        for index, candidate in zip(missing, self._executor.map(_evaluate, jobs, chunksize=chunk)):
+            candidates[index] = candidate
+            if self.store is not None:
+                self.store.record(candidate, self.base_position, SIM_SOURCE)
+        self.evaluations += len(missing)
+        self.results.extend(candidates)
+        return candidates
+
+    def step(self):
+        """Run one generation; returns its best Candidate."""
+        offsets = np.clip(self.search.ask(), -self.max_offset, self.max_offset)
+        candidates = self.evaluate([pattern_from_offsets(self.pattern, row, self.max_offset) for row in offsets])
+        self.search.tell(offsets, [candidate.score for candidate in candidates])
+        return min(candidates, key=lambda candidate: candidate.score)
+
+    def run(self, generations, callback=None):
+        """Run 'generations' generations, calling callback(generation, best) after each."""
+        for generation in range(generations):
+            best = self.step()
+            if callback is not None:
+                callback(generation, best)
+        return self.top(1)[0]
+
+    def top(self, k):
+        """The 'k' best distinct candidates evaluated so far."""
+        best, seen = [], set()
+        for candidate in sorted(self.results, key=lambda candidate: candidate.score):
+            key = tuple(round(step[joint], 3) for step in candidate.pattern for joint in JOINT_ORDER)
+            if key not in seen:
+                seen.add(key)
+                best.append(candidate)
+                if len(best) == k:
+                    break
+        return best
+
+
+def validate_on_hardware(candidates, execute_pattern, measure_stability):
+    """
+    Re-score 'candidates' on the robot with cycle_mpu.py's execute_pattern(pattern)
+    and measure_stability(). Returns hardware Candidates, best first.
+    """
+    measured = []
+    for candidate in candidates:
+        execute_pattern(candidate.pattern)
+        pitch_dev, roll_dev = measure_stability()
+        measured.append(Candidate(pitch_dev + roll_dev, pitch_dev, roll_dev, candidate.pattern))
+    return sorted(measured, key=lambda candidate: candidate.score)
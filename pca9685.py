@@ -0,0 +1,217 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# ==========================
+# PCA9685 Registers
+# ==========================
+PCA9685_ADDR = 0x40
+MODE1 = 0x00
+MODE2 = 0x01
+LED0_ON_L = 0x06
+PRE_SCALE = 0xFE
+
+MODE1_RESTART = 0x80
+MODE1_AI = 0x20      # register auto-increment
+MODE1_SLEEP = 0x10
+MODE2_OUTDRV = 0x04  # totem-pole outputs
+LED_FULL_OFF = 0x10  # bit 4 of LEDn_OFF_H
+FULL_OFF_REGISTERS = bytes((0, 0, 0, LED_FULL_OFF))
+
+OSCILLATOR_HZ = 25_000_000
+CHANNELS = 16
+SERVO_FREQUENCY = 50
+
+# smbus block writes are limited to 32 bytes (8 channels) per transaction
+I2C_BLOCK_MAX = 32
+
+# Servo channels from "REMEMBER ME - PINOUT"
+PCA_SERVO_CHANNELS = {
+    "Hip Left": 0,
+    "Knee Left": 14,
+    "Hip Right": 1,
+    "Knee Right": 15,
+    "Left Toe": 13,
+    "Right Toe": 12,
+}
+
+
+def open_bus(bus_number=1):
+    """smbus2 when installed (it can send frames longer than 32 bytes), else smbus."""
+    try:
+        import smbus2
+        return smbus2.SMBus(bus_number)
+    except ImportError:
+        import smbus
+        return smbus.SMBus(bus_number)
+
+
+def _flush(bus):
+    """Wait until writes queued on an i2c_bus.BusProxy have reached the board."""
+    flush = getattr(bus, "flush", None)
+    if flush is not None:
+        flush()
+
+
+class PCA9685:
+    """
+    PCA9685 servo board that writes whole frames with auto-increment.
+
+    The driver owns every channel on the board: the first frame sets every
+    channel it was not told to drive to full-off, as after power-on. Each
+    commit_frame() writes the LEDn_ON/OFF registers of all changed channels
+    (and any channels between them) starting at the first one, as a single
+    I2C write when the bus is smbus2 and in 32-byte blocks with plain smbus.
+    The prescaler is cached and only rewritten when the frequency changes.
+    Register setup goes over 'config_bus' when given (an i2c_bus.BusProxy on
+    the config lane, say) and over 'bus' otherwise.
+
+    set_servo_pulsewidth() and commit_frame() take the same arguments as
+    ServoOutput, with PCA channels in place of GPIO pins.
+    """
+
+    def __init__(self, bus=None, address=PCA9685_ADDR, frequency=SERVO_FREQUENCY, config_bus=None):
+        self.bus = open_bus() if bus is None else bus
+        self.config_bus = self.bus if config_bus is None else config_bus
+        self.address = address
+        self.frequency = None
+        self.registers = [None] * CHANNELS  # unknown until the first frame
+        self.last_pulsewidth = {}
+        self.transactions = 0
+        self.frames = 0
+        self.config_bus.write_byte_data(self.address, MODE2, MODE2_OUTDRV)
+        # Keep the prescaler the board already runs at if it matches
+        self.prescale = self.config_bus.read_byte_data(self.address, PRE_SCALE)
+        self.config_bus.write_byte_data(self.address, MODE1, MODE1_AI)
+        self.set_frequency(frequency)
+
+    def set_frequency(self, frequency):
+        """Set the PWM frequency; the prescaler is only rewritten when it changes."""
+        prescale = round(OSCILLATOR_HZ / (4096 * frequency)) - 1
+        prescale = max(3, min(255, prescale))
+        if prescale != self.prescale:
+            # PRE_SCALE can only be written while the oscillator sleeps
+            self.config_bus.write_byte_data(self.address, MODE1, MODE1_SLEEP | MODE1_AI)
+            self.config_bus.write_byte_data(self.address, PRE_SCALE, prescale)
+            self.config_bus.write_byte_data(self.address, MODE1, MODE1_AI)
+            _flush(self.config_bus)  # the wake write must be on the board before the wait starts
+            time.sleep(0.0005)  # oscillator start-up
+            self.config_bus.write_byte_data(self.address, MODE1, MODE1_RESTART | MODE1_AI)
+            self.prescale = prescale
+        # Frames go over 'bus', which must not overtake the setup
+        _flush(self.config_bus)
+        self.frequency = OSCILLATOR_HZ / (4096 * (prescale + 1))
+        return self.frequency
+
+    def pulsewidth_to_registers(self, pulsewidth):
+        """LEDn_ON_L..LEDn_OFF_H bytes for a pulse of 'pulsewidth' µs (0 = off)."""
+        if pulsewidth <= 0:
+            return FULL_OFF_REGISTERS
+        off = min(4095, round(pulsewidth * self.frequency * 4096 / 1e6))
+        return bytes((0, 0, off & 0xFF, off >> 8))
+
+    def set_servo_pulsewidth(self, channel, pulsewidth):
+        return self.commit_frame({channel: pulsewidth})
+
+    def commit_frame(self, pulsewidths):
+        """Write a {channel: pulsewidth} pose in one bus transaction. Returns True if sent."""
+        registers = list(self.registers)
+        for channel, pulsewidth in pulsewidths.items():
+            registers[channel] = self.pulsewidth_to_registers(pulsewidth)
+        registers = [FULL_OFF_REGISTERS if value is None else value for value in registers]
+        dirty = [channel for channel in range(CHANNELS) if registers[channel] != self.registers[channel]]
+        if not dirty:
+            return False
+
+        first, last = dirty[0], dirty[-1]
+        self._write_block(LED0_ON_L + 4 * first, b"".join(registers[first:last + 1]))
+        self.registers = registers
+        self.last_pulsewidth.update(pulsewidths)
+        self.frames += 1
+        return True
+
+    def all_off(self):
+        self.commit_frame({channel: 0 for channel in range(CHANNELS)})
+
+    def close(self):
+        _flush(self.bus)
+        _flush(self.config_bus)
+
+    def _write_block(self, register, data):
+        if hasattr(self.bus, "i2c_rdwr"):
+            from smbus2 import i2c_msg
+            self.bus.i2c_rdwr(i2c_msg.write(self.address, bytes((register,)) + data))
+            self.transactions += 1
+            return
+        for start in range(0, len(data), I2C_BLOCK_MAX):
+            self.bus.write_i2c_block_data(self.address, register + start, list(data[start:start + I2C_BLOCK_MAX]))
+            self.transactions += 1
+
+
+# ==========================
+# Chained Boards
+# ==========================
+class PCA9685Chain:
+    """
+    Several PCA9685 boards driven as one servo output.
+
+    'joint_map' maps each logical joint to (address, channel), or to
+    (bus_number, address, channel) for boards on another I2C bus, e.g.
+
+        chain = PCA9685Chain({"Hip Left": (0x40, 0), "Elbow Left": (0x41, 3)})
+        chain.commit_frame({"Hip Left": 1500, "Elbow Left": 1200})
+
+    A frame is one bulk write per board that actually changed. Boards that
+    share a bus are flushed back to back in address order; separate buses
+    are flushed in parallel threads, so adding boards on a second bus adds
+    almost nothing to the frame time.
+    """
+
+    def __init__(self, joint_map, frequency=SERVO_FREQUENCY, buses=None):
+        self.buses = dict(buses or {})
+        self.boards = {}
+        self.joint_map = {}
+        for joint, location in joint_map.items():
+            bus_number, address, channel = location if len(location) == 3 else (1,) + tuple(location)
+            if not 0 <= channel < CHANNELS:
+                raise ValueError(f"{joint!r}: channel must be 0..{CHANNELS - 1}, got {channel}")
+            key = (bus_number, address)
+            if key not in self.boards:
+                if bus_number not in self.buses:
+                    self.buses[bus_number] = open_bus(bus_number)
+                self.boards[key] = PCA9685(self.buses[bus_number], address, frequency)
+            self.joint_map[joint] = (key, channel)
+
+        self.bus_boards = {}
+        for bus_number, address in sorted(self.boards):
+            self.bus_boards.setdefault(bus_number, []).append(self.boards[(bus_number, address)])
+        self._executor = ThreadPoolExecutor(len(self.bus_boards)) if len(self.bus_boards) > 1 else None
+
+    def set_servo_pulsewidth(self, joint, pulsewidth):
+        return self.commit_frame({joint: pulsewidth})
+
+    def commit_frame(self, pulsewidths):
+        """Write a {joint: pulsewidth} pose. Returns the number of boards written."""
+        per_board = {}
+        for joint, pulsewidth in pulsewidths.items():
+            key, channel = self.joint_map[joint]
+            per_board.setdefault(key, {})[channel] = pulsewidth
+
+        per_bus = {}
+        for (bus_number, address), frame in sorted(per_board.items()):
+            per_bus.setdefault(bus_number, []).append((self.boards[(bus_number, address)], frame))
+
+        if self._executor is None or len(per_bus) == 1:
+            return sum(self._flush_bus(jobs) for jobs in per_bus.values())
+        return sum(self._executor.map(self._flush_bus, per_bus.values()))
+
+    def all_off(self):
+        for board in self.boards.values():
+            board.all_off()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    @staticmethod
+    def _flush_bus(jobs):
+        return sum(board.commit_frame(frame) for board, frame in jobs)
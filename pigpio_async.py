@@ -0,0 +1,326 @@
+import asyncio
+import os
+import struct
+import time
+from collections import deque
+
+from hal import LatencyStats
+
+# ==========================
+# asyncio pigpio Client
+# ==========================
+# pigpio.pi() sends one command over its socket and blocks until the reply
+# comes back, so a six-joint pose is six round trips in a row. The daemon
+# answers the commands on a connection strictly in order, so a client may
+# write any number of them back to back and pair the replies with the
+# requests by position. AsyncPigpio does exactly that: every call writes its
+# request at once and returns a future, and a reader task resolves the
+# futures as replies arrive. commit_frame() puts a whole pose on the wire in
+# one write, so it costs about one round trip however many joints move.
+#
+# Wire format (pigpio's socket interface): a request is four little-endian
+# uint32 (command, p1, p2, p3), where p3 is the length of any extension
+# bytes that follow. The reply is the same 16 bytes with the result, an
+# int32, in place of p3; negative results are pigpio error codes.
+#
+# FakePigpioDaemon serves the same protocol from in-process state, with an
+# optional reply delay to model the link, for trying clients without a Pi.
+
+PIGPIO_HOST = os.environ.get("PIGPIO_ADDR", "localhost")
+PIGPIO_PORT = int(os.environ.get("PIGPIO_PORT", 8888))
+
+REQUEST = struct.Struct("<IIII")
+RESPONSE = struct.Struct("<IIIi")
+
+# Command codes
+CMD_MODES = 0
+CMD_MODEG = 1
+CMD_PUD = 2
+CMD_READ = 3
+CMD_WRITE = 4
+CMD_SERVO = 8
+CMD_TICK = 16
+CMD_HWVER = 17
+CMD_GPW = 84
+
+# Error codes (subset of pigpio.h)
+PI_BAD_USER_GPIO = -2
+PI_BAD_GPIO = -3
+PI_BAD_MODE = -4
+PI_BAD_LEVEL = -5
+PI_BAD_PUD = -6
+PI_BAD_PULSEWIDTH = -7
+PI_NOT_SERVO_GPIO = -93
+PI_UNKNOWN_COMMAND = -123
+
+ERROR_TEXT = {
+    PI_BAD_USER_GPIO: "GPIO not 0-31",
+    PI_BAD_GPIO: "GPIO not 0-53",
+    PI_BAD_MODE: "mode not 0-7",
+    PI_BAD_LEVEL: "level not 0-1",
+    PI_BAD_PUD: "pud not 0-2",
+    PI_BAD_PULSEWIDTH: "pulsewidth not 0 or 500-2500",
+    PI_NOT_SERVO_GPIO: "GPIO is not in use for servo pulses",
+    PI_UNKNOWN_COMMAND: "unknown command",
+}
+
+MAX_GPIO = 53
+MAX_USER_GPIO = 31  # servo pulses are only available on GPIO 0-31
+# Commands whose result is an unsigned 32-bit value rather than a status
+UNSIGNED_RESULTS = (CMD_TICK, CMD_HWVER)
+
+
+class PigpioError(Exception):
+    """A command was answered with a negative pigpio error code."""
+
+    def __init__(self, command, code):
+        super().__init__(f"pigpio command {command} failed: {ERROR_TEXT.get(code, code)} ({code})")
+        self.command = command
+        self.code = code
+
+
+class AsyncPigpio:
+    """
+    Pipelining pigpio client:
+
+        pi = AsyncPigpio()
+        await pi.connect()
+        await pi.commit_frame({23: 1500, 22: 1200, 27: 1500})   # one round trip
+        tick = await pi.get_current_tick()
+        await pi.close()
+
+    Calls may be issued from many tasks at once; the replies are matched in
+    order. 'latency' records the time of each commit_frame().
+    """
+
+    def __init__(self, host=PIGPIO_HOST, port=PIGPIO_PORT):
+        self.host = host
+        self.port = port
+        self.latency = LatencyStats()
+        self.commands = 0
+        self._reader = None
+        self._writer = None
+        self._pending = deque()
+        self._receiver = None
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._receiver = asyncio.create_task(self._receive())
+        return self
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+        if self._receiver is not None:
+            self._receiver.cancel()
+            await asyncio.gather(self._receiver, return_exceptions=True)
+            self._receiver = None
+        self._fail_pending(ConnectionError("pigpio connection closed"))
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ----- pipelining -----
+    def submit(self, command, p1=0, p2=0, extension=b""):
+        """Write one request now; returns a future for its result. Call drain() to flush."""
+        if not self.connected:
+            raise ConnectionError("not connected to the pigpio daemon")
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((command, future))
+        self._writer.write(REQUEST.pack(command, p1, p2, len(extension)) + extension)
+        self.commands += 1
+        return future
+
+    async def drain(self):
+        await self._writer.drain()
+
+    async def command(self, command, p1=0, p2=0, extension=b""):
+        future = self.submit(command, p1, p2, extension)
+        await self.drain()
+        return await future
+
+    async def _receive(self):
+        try:
+            while True:
+                reply = await self._reader.readexactly(RESPONSE.size)
+                command, _, _, result = RESPONSE.unpack(reply)
+                if not self._pending:
+                    raise ConnectionError(f"unexpected reply to command {command}")
+                expected, future = self._pending.popleft()
+                if command != expected:
+                    raise ConnectionError(f"reply to command {command} while waiting for {expected}")
+                if future.cancelled():
+                    continue
+                if command in UNSIGNED_RESULTS:
+                    future.set_result(result & 0xFFFFFFFF)
+                elif result < 0:
+                    future.set_exception(PigpioError(command, result))
+                else:
+                    future.set_result(result)
+        except (asyncio.IncompleteReadError, ConnectionError) as error:
+            # Replies can no longer be matched to requests: fail everything
+            # in flight and refuse new requests
+            self._writer.close()
+            self._fail_pending(error if isinstance(error, ConnectionError)
+                               else ConnectionError("pigpio daemon closed the connection"))
+
+    def _fail_pending(self, error):
+        while self._pending:
+            _, future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    # ----- pigpio.pi equivalents -----
+    async def set_servo_pulsewidth(self, gpio, pulsewidth):
+        return await self.command(CMD_SERVO, gpio, int(pulsewidth))
+
+    async def get_servo_pulsewidth(self, gpio):
+        return await self.command(CMD_GPW, gpio)
+
+    async def set_mode(self, gpio, mode):
+        return await self.command(CMD_MODES, gpio, mode)
+
+    async def get_mode(self, gpio):
+        return await self.command(CMD_MODEG, gpio)
+
+    async def set_pull_up_down(self, gpio, pud):
+        return await self.command(CMD_PUD, gpio, pud)
+
+    async def read(self, gpio):
+        return await self.command(CMD_READ, gpio)
+
+    async def write(self, gpio, level):
+        return await self.command(CMD_WRITE, gpio, level)
+
+    async def get_current_tick(self):
+        return await self.command(CMD_TICK)
+
+    async def get_hardware_revision(self):
+        return await self.command(CMD_HWVER)
+
+    async def commit_frame(self, pulsewidths):
+        """Send a {gpio: pulsewidth} pose as one pipelined batch; returns after every reply."""
+        start = time.perf_counter()
+        futures = [self.submit(CMD_SERVO, pin, int(pulsewidth)) for pin, pulsewidth in pulsewidths.items()]
+        await self.drain()
+        await asyncio.gather(*futures)
+        self.latency.add(time.perf_counter() - start)
+        return True
+
+
+# ==========================
+# Fake Daemon
+# ==========================
+class FakePigpioDaemon:
+    """
+    In-process stand-in for pigpiod on a TCP port (0 picks a free one):
+
+        daemon = FakePigpioDaemon(reply_delay=0.001)
+        await daemon.start()
+        pi = await AsyncPigpio(port=daemon.port).connect()
+
+    Replies go out in order 'reply_delay' seconds after each request
+    arrives, like a link with that round trip time. 'servos', 'modes' and
+    'levels' hold the GPIO state; 'log' every (command, p1, p2) received.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, reply_delay=0.0, hardware_revision=0xA02082):
+        self.host = host
+        self.port = port
+        self.reply_delay = reply_delay
+        self.hardware_revision = hardware_revision
+        self.servos = {}
+        self.modes = {}
+        self.levels = {}
+        self.log = []
+        self.connections = 0
+        self._server = None
+        self._start = time.monotonic()
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                command, p1, p2, p3 = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+                if p3:
+                    await reader.readexactly(p3)
+                reply = RESPONSE.pack(command, p1, p2, self.execute(command, p1, p2))
+                if self.reply_delay:
+                    loop.call_later(self.reply_delay, self._reply, writer, reply)
+                else:
+                    writer.write(reply)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _reply(writer, reply):
+        if not writer.is_closing():
+            writer.write(reply)
+
+    def execute(self, command, p1, p2):
+        """Apply one command to the fake GPIO state; returns the result code."""
+        self.log.append((command, p1, p2))
+        if command == CMD_TICK:
+            return int((time.monotonic() - self._start) * 1e6) & 0x7FFFFFFF
+        if command == CMD_HWVER:
+            return self.hardware_revision
+        if command in (CMD_SERVO, CMD_GPW) and p1 > MAX_USER_GPIO:
+            return PI_BAD_USER_GPIO
+        if p1 > MAX_GPIO:
+            return PI_BAD_GPIO
+        if command == CMD_SERVO:
+            if p2 != 0 and not 500 <= p2 <= 2500:
+                return PI_BAD_PULSEWIDTH
+            self.servos[p1] = p2
+            self.modes[p1] = 1  # pigpio switches the GPIO to output
+            return 0
+        if command == CMD_GPW:
+            return self.servos[p1] if self.servos.get(p1) else PI_NOT_SERVO_GPIO
+        if command == CMD_MODES:
+            if p2 > 7:
+                return PI_BAD_MODE
+            self.modes[p1] = p2
+            return 0
+        if command == CMD_MODEG:
+            return self.modes.get(p1, 0)
+        if command == CMD_PUD:
+            return 0 if p2 <= 2 else PI_BAD_PUD
+        if command == CMD_READ:
+            return self.levels.get(p1, 0)
+        if command == CMD_WRITE:
+            if p2 > 1:
+                return PI_BAD_LEVEL
+            self.levels[p1] = p2
+            self.servos.pop(p1, None)
+            self.modes[p1] = 1
+            return 0
+        return PI_UNKNOWN_COMMAND
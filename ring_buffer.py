@@ -0,0 +1,75 @@
+# ==========================
+# Lock-free Ring Buffer
+# ==========================
+# One producer (e.g. the pigpio callback thread) pushes, any number of
+# readers follow it with their own cursors. Nothing is locked: the producer
+# writes the slot before bumping 'head', and a plain assignment is atomic
+# under the GIL, so a reader never sees a slot that is not yet written.
+# Each slot holds (sequence number, item), so a reader can tell an item it
+# expected from a newer one the producer has just written over it, even
+# before 'head' shows that. If a reader falls more than 'capacity' items
+# behind, the oldest items are overwritten and counted in its 'overruns'.
+
+
+class RingBuffer:
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError(f"capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self.head = 0  # total number of items ever pushed
+
+    def push(self, item):
+        """Store 'item', overwriting the oldest slot when full. Producer only."""
+        head = self.head
+        self._slots[head % self.capacity] = (head, item)
+        self.head = head + 1
+
+    def latest(self):
+        """Most recently pushed item, or None if nothing was pushed yet."""
+        head = self.head
+        if head == 0:
+            return None
+        return self._slots[(head - 1) % self.capacity][1]
+
+    def reader(self, from_start=False):
+        """New cursor that sees items pushed from now on (or everything still held)."""
+        return RingReader(self, from_start)
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+
+class RingReader:
+    """Independent read cursor into a RingBuffer."""
+
+    def __init__(self, ring, from_start=False):
+        self.ring = ring
+        self.tail = max(0, ring.head - ring.capacity) if from_start else ring.head
+        self.overruns = 0
+
+    def available(self):
+        return min(self.ring.head - self.tail, self.ring.capacity)
+
+    def read(self, max_items=None):
+        """Return the unread items, oldest first, and advance the cursor."""
+        ring = self.ring
+        capacity = ring.capacity
+        head = ring.head
+        tail = self.tail
+        if head - tail > capacity:
+            self.overruns += head - tail - capacity
+            tail = head - capacity
+        if max_items is not None:
+            head = min(head, tail + max_items)
+
+        slots = ring._slots
+        items = []
+        for index in range(tail, head):
+            sequence, item = slots[index % capacity]
+            # A newer sequence number: the producer lapped us while copying
+            if sequence == index:
+                items.append(item)
+        self.overruns += head - tail - len(items)
+        self.tail = head
+        return items
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hal import LatencyStats
+
+# ==========================
+# asyncio Control Runtime
+# ==========================
+# Sensing, control, servo output and telemetry as four asyncio tasks joined
+# by queues, instead of one loop that reads the IMU, computes, writes the
+# servos and sleeps in turn:
+#
+#   sense ──samples──> control ──poses──> output
+#                         └──telemetry──> telemetry
+#
+# The blocking I2C read and pigpio write each run on their own one-thread
+# executor, so the read of sample n+1 overlaps the write of pose n and one
+# control cycle costs max(read, write) instead of read + write. Each device
+# still sees one call at a time. The sample and pose queues hold one item
+# and keep the newest: if a stage falls behind, stale data is dropped.
+#
+# run() is a coroutine for code that is already async; start()/stop() run it
+# on a daemon thread for the synchronous scripts and the tkinter GUIs.
+
+CONTROL_RATE = 200   # Hz
+TELEMETRY_RATE = 10  # Hz
+
+
+def put_latest(queue, item):
+    """put_nowait() that drops the oldest item when 'queue' is full. Returns True if one was dropped."""
+    dropped = False
+    if queue.full():
+        queue.get_nowait()
+        dropped = True
+    queue.put_nowait(item)
+    return dropped
+
+
+class ControlRuntime:
+    """
+    Run control(sample) -> pose for every IMU sample and send each pose with
+    output(pose):
+
+        runtime = ControlRuntime(imu, balancer.correct, send_pose)
+        runtime.start()               # or: await runtime.run(duration=10)
+        ...
+        runtime.stop()
+        print(runtime.report())
+
+    'imu' may be None, in which case control(None) is called at 'rate' (a
+    gait player, say). 'rate' None samples as fast as the IMU answers, and
+    a paced IMU (hal.ImuSource.paced) is always read at its own rate.
+    control() runs on the event loop and must not block; returning None
+    sends nothing. 'output' may also be a coroutine function, such as
+    pigpio_async.AsyncPigpio.commit_frame, which is awaited in place.
+    telemetry(sample, pose) gets the newest pair at 'telemetry_rate' Hz.
+    """
+
+    def __init__(self, imu, control, output, rate=CONTROL_RATE, telemetry=None, telemetry_rate=TELEMETRY_RATE):
+        if rate is not None and rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        if imu is None and rate is None:
+            raise ValueError("a runtime without an IMU needs a rate")
+        self.imu = imu
+        self.control = control
+        self.output = output
+        self.rate = rate
+        self.telemetry = telemetry
+        self.telemetry_rate = telemetry_rate
+        # Time spent in each stage, and from sample timestamp to pose sent
+        self.sense_latency = LatencyStats()
+        self.control_latency = LatencyStats()
+        self.output_latency = LatencyStats()
+        self.cycle_latency = LatencyStats()
+        self.samples = 0
+        self.frames = 0
+        self.dropped_samples = 0
+        self.dropped_poses = 0
+        self.skipped_periods = 0
+        self.elapsed = 0.0
+        self.running = False
+        self._thread = None
+        self._stopping = threading.Event()
+
+    # ----- tasks -----
+    async def _sense(self, executor, samples, stop, end):
+        loop = asyncio.get_running_loop()
+        period = None if self.rate is None or (self.imu is not None and self.imu.paced) else 1.0 / self.rate
+        deadline = loop.time()
+        while not self._stopping.is_set() and not (stop is not None and stop()):
+            if end is not None and loop.time() >= end:
+                break
+            if self.imu is None:
+                sample = None
+            else:
+                start = time.perf_counter()
+                sample = await loop.run_in_executor(executor, self.imu.read_sample)
+                self.sense_latency.add(time.perf_counter() - start)
+            self.samples += 1
+            if put_latest(samples, sample):
+                self.dropped_samples += 1
+            if period is None:
+                await asyncio.sleep(0)
+                continue
+            # Absolute deadlines; missed periods are skipped, as in RateScheduler
+            deadline += period
+            now = loop.time()
+            if now > deadline:
+                missed = int((now - deadline) / period) + 1
+                self.skipped_periods += missed
+                deadline += missed * period
+            await asyncio.sleep(deadline - now)
+
+    async def _control(self, samples, poses, telemetry):
+        while True:
+            sample = await samples.get()
+            start = time.perf_counter()
+            pose = self.control(sample)
+            self.control_latency.add(time.perf_counter() - start)
+            if pose is None:
+                continue
+            if put_latest(poses, (sample, pose)):
+                self.dropped_poses += 1
+            if telemetry is not None:
+                put_latest(telemetry, (sample, pose))
+
+    async def _output(self, executor, poses):
+        loop = asyncio.get_running_loop()
+        while True:
+            sample, pose = await poses.get()
+            start = time.perf_counter()
+            if asyncio.iscoroutinefunction(self.output):
+                await self.output(pose)
+            else:
+                await loop.run_in_executor(executor, self.output, pose)
+            self.output_latency.add(time.perf_counter() - start)
+            if sample is not None:
+                self.cycle_latency.add(time.monotonic() - sample.timestamp)
+            self.frames += 1
+
+    async def _telemetry(self, queue):
+        while True:
+            await asyncio.sleep(1.0 / self.telemetry_rate)
+            if not queue.empty():
+                self.telemetry(*queue.get_nowait())
+
+    # ----- running -----
+    async def run(self, duration=None, stop=None):
+        """
+        Run until stop() is called, 'duration' seconds pass, or the 'stop'
+        callable returns True (checked before every sample). An exception in
+        any task cancels the others and is raised here.
+        """
+        loop = asyncio.get_running_loop()
+        end = None if duration is None else loop.time() + duration
+        samples = asyncio.Queue(maxsize=1)
+        poses = asyncio.Queue(maxsize=1)
+        telemetry = asyncio.Queue(maxsize=1) if self.telemetry is not None else None
+        imu_executor = ThreadPoolExecutor(1, thread_name_prefix="runtime-imu")
+        servo_executor = ThreadPoolExecutor(1, thread_name_prefix="runtime-servo")
+
+        sense = asyncio.create_task(self._sense(imu_executor, samples, stop, end))
+        workers = [asyncio.create_task(self._control(samples, poses, telemetry)),
+                   asyncio.create_task(self._output(servo_executor, poses))]
+        if telemetry is not None:
+            workers.append(asyncio.create_task(self._telemetry(telemetry)))
+
+        self.running = True
+        started = loop.time()
+        try:
+            done, _ = await asyncio.wait([sense] + workers, return_when=asyncio.FIRST_COMPLETED)
+            if sense in done:
+                # Let the last pose go out before shutting down
+                while not (samples.empty() and poses.empty()) and not any(task.done() for task in workers):
+                    await asyncio.sleep(0)
+            for task in done:
+                task.result()
+        finally:
+            for task in [sense] + workers:
+                task.cancel()
+            await asyncio.gather(sense, *workers, return_exceptions=True)
+            imu_executor.shutdown()
+            servo_executor.shutdown()
+            self.elapsed = loop.time() - started
+            self.running = False
+
+    def start(self):
+        """Run the runtime on its own event loop in a daemon thread."""
+        self._stopping.clear()
+        self._thread = threading.Thread(target=asyncio.run, args=(self.run(),), daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        """
+        Stop sampling; returns once the last pose has been sent. With
+        wait=False it only signals the thread, for callers such as a tkinter
+        handler that must not block: poll 'finished', then call stop() again.
+        """
+        self._stopping.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def finished(self):
+        """True when the runtime thread is not running (or was never started)."""
+        return self._thread is None or not self._thread.is_alive()
+
+    def report(self):
+        rate = self.frames / self.elapsed if self.elapsed else 0.0
+        return (f"{self.frames} poses in {self.elapsed:.1f} s ({rate:.1f} Hz), "
+                f"dropped samples={self.dropped_samples} poses={self.dropped_poses} "
+                f"skipped periods={self.skipped_periods}\n"
+                f"    sense   {self.sense_latency}\n"
+                f"    control {self.control_latency}\n"
+                f"    output  {self.output_latency}\n"
+                f"    sample-to-command {self.cycle_latency}")
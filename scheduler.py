@@ -0,0 +1,180 @@
+import heapq
+import time
+
+# ==========================
+# Fixed-rate Task Scheduler
+# ==========================
+# Tasks run against absolute time.monotonic_ns() deadlines, so the time a
+# task (or a pigpio call, or a print) takes never pushes later frames back.
+# When a task overruns, the frames it missed are skipped rather than run
+# back-to-back, and the next run lands on the original period grid.
+
+# Histogram bucket upper edges in microseconds; the last bucket is open ended
+JITTER_EDGES_US = (50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# Period histogram edges as fractions of the nominal period
+PERIOD_EDGE_RATIOS = (0.5, 0.9, 0.99, 1.01, 1.1, 1.5, 2.0)
+
+# Sleep until this close to a deadline, then spin for the rest
+SPIN_NS = 200_000
+
+
+class Histogram:
+    def __init__(self, edges):
+        self.edges = tuple(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+
+    def add(self, value):
+        for i, edge in enumerate(self.edges):
+            if value <= edge:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def labels(self):
+        lows = ("",) + tuple(f"{edge:g}" for edge in self.edges)
+        highs = tuple(f"{edge:g}" for edge in self.edges) + ("",)
+        return [f"{low}..{high}" for low, high in zip(lows, highs)]
+
+    def __repr__(self):
+        return ", ".join(f"{label}: {count}" for label, count in zip(self.labels(), self.counts) if count)
+
+
+class TaskStats:
+    """
+    Timing record for one task; all histograms are in microseconds.
+    jitter: start time minus deadline. period: start-to-start interval.
+    overrun: how far the task's own run time exceeded its period.
+    """
+
+    def __init__(self, period_ns):
+        period_us = period_ns / 1000
+        self.runs = 0
+        self.skipped_frames = 0
+        self.overruns = 0
+        self.max_jitter_us = 0.0
+        self.max_exec_us = 0.0
+        self.jitter = Histogram(JITTER_EDGES_US)
+        self.period = Histogram(round(period_us * ratio) for ratio in PERIOD_EDGE_RATIOS)
+        self.overrun = Histogram(JITTER_EDGES_US)
+
+    def __repr__(self):
+        return (f"runs={self.runs} skipped={self.skipped_frames} overruns={self.overruns} "
+                f"max_jitter={self.max_jitter_us:.0f}us max_exec={self.max_exec_us:.0f}us\n"
+                f"    jitter  [{self.jitter}]\n"
+                f"    period  [{self.period}]\n"
+                f"    overrun [{self.overrun}]")
+
+
+class _Task:
+    def __init__(self, name, period_ns, fn, deadline):
+        self.name = name
+        self.period_ns = period_ns
+        self.fn = fn
+        self.deadline = deadline
+        self.last_start = None
+        self.stats = TaskStats(period_ns)
+
+
+class RateScheduler:
+    """
+    Run registered callables at fixed periods on one thread.
+
+        scheduler = RateScheduler()
+        scheduler.add_task("gait", 0.02, play_next_frame)    # 50 Hz
+        scheduler.add_task("imu", 0.005, read_imu)           # 200 Hz
+        scheduler.run(duration=10)
+        print(scheduler.report())
+    """
+
+    def __init__(self, spin_ns=SPIN_NS, clock=time.monotonic_ns, sleep=time.sleep):
+        self.spin_ns = spin_ns
+        self.clock = clock
+        self.sleep = sleep
+        self.tasks = {}
+        self._queue = []
+        self._seq = 0
+        self._running = False
+
+    def add_task(self, name, period, fn, phase=0.0):
+        """Run 'fn()' every 'period' seconds, first after 'phase' seconds."""
+        if period <= 0:
+            raise ValueError(f"period must be positive, got {period}")
+        if name in self.tasks:
+            raise ValueError(f"task {name!r} is already registered")
+        task = _Task(name, int(period * 1e9), fn, self.clock() + int(phase * 1e9))
+        self.tasks[name] = task
+        self._push(task)
+        return task.stats
+
+    def remove_task(self, name):
+        task = self.tasks.pop(name)
+        self._queue = [entry for entry in self._queue if entry[2] is not task]
+        heapq.heapify(self._queue)
+
+    def stop(self):
+        """Make run() return after the task currently executing."""
+        self._running = False
+
+    def run(self, duration=None, stop=None):
+        """
+        Run until stop() is called, 'duration' seconds pass, or the
+        'stop' callable returns True (checked before every task).
+        """
+        end = None if duration is None else self.clock() + int(duration * 1e9)
+        self._running = True
+        while self._running and self._queue:
+            deadline, _, task = self._queue[0]
+            if end is not None and deadline >= end:
+                break
+            self._wait_until(deadline)
+            if stop is not None and stop():
+                break
+            heapq.heappop(self._queue)
+            self._run_task(task)
+            self._push(task)
+        self._running = False
+
+    def stats(self):
+        return {name: task.stats for name, task in self.tasks.items()}
+
+    def report(self):
+        return "\n".join(f"{name} @ {1e9 / task.period_ns:.1f} Hz: {task.stats}" for name, task in self.tasks.items())
+
+    def _push(self, task):
+        self._seq += 1
+        heapq.heappush(self._queue, (task.deadline, self._seq, task))
+
+    def _wait_until(self, deadline):
+        remaining = deadline - self.clock()
+        if remaining > self.spin_ns:
+            self.sleep((remaining - self.spin_ns) / 1e9)
+        while self.clock() < deadline:
+            pass
+
+    def _run_task(self, task):
+        stats = task.stats
+        start = self.clock()
+        jitter_us = (start - task.deadline) / 1000
+        stats.jitter.add(jitter_us)
+        stats.max_jitter_us = max(stats.max_jitter_us, jitter_us)
+        if task.last_start is not None:
+            stats.period.add((start - task.last_start) / 1000)
+        task.last_start = start
+
+        task.fn()
+
+        finish = self.clock()
+        exec_ns = finish - start
+        stats.runs += 1
+        stats.max_exec_us = max(stats.max_exec_us, exec_ns / 1000)
+        if exec_ns > task.period_ns:
+            stats.overruns += 1
+            stats.overrun.add((exec_ns - task.period_ns) / 1000)
+
+        # Frames whose deadline already passed (because this task or another
+        # one ran long) are dropped so the task re-joins its period grid
+        task.deadline += task.period_ns
+        if finish > task.deadline:
+            missed = (finish - task.deadline) // task.period_ns + 1
+            stats.skipped_frames += missed
+            task.deadline += missed * task.period_ns
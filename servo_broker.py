@@ -0,0 +1,431 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from hal import ImuSource, ServoBus, open_imu, open_servo_bus, select_backend
+from mpu6050 import ImuSample
+
+# ==========================
+# Servo and IMU Broker
+# ==========================
+# One long-running process owns the servo backend (pigpio connection or
+# PCA9685) and the MPU6050, and every script talks to it over a Unix socket
+# instead of opening the hardware itself:
+#
+#   python servo_broker.py --backend pigpio &
+#   python gui.py --backend broker
+#   python cycle_mpu.py --backend broker
+#
+# Joints are leased: a client that sends a frame for a joint, or acquires it
+# up front, owns it until it releases it, disconnects, or lets the lease run
+# out without sending anything. Frames for joints another client owns are
+# refused as a whole, so two tools can never write the same servo. Closing a
+# client switches off only the joints it owned.
+#
+# The IMU is sampled on the broker at IMU_RATE and clients get the newest
+# sample, so any number of readers cost one stream of I2C reads. A client
+# that passes the timestamp of the last sample it got waits for a newer
+# one, so it never sees the same reading twice.
+#
+# Protocol: one JSON object per line each way. A request is
+# {"id": n, "op": name, ...arguments}; the reply is {"id": n, "result": ...}
+# or {"id": n, "error": message, "type": exception name}. Requests on one
+# connection are answered in order, so a client may write several before
+# reading any replies (BrokerClient.batch()).
+
+DEFAULT_SOCKET = os.environ.get("ROBOT_BROKER", "/tmp/robot-broker.sock")
+DEFAULT_LEASE = 2.0  # seconds a joint stays owned without a frame or acquire
+IMU_RATE = 200       # Hz
+IMU_TIMEOUT = 1.0    # seconds an "imu" request waits for a new sample
+
+
+class JointBusyError(RuntimeError):
+    """A joint is leased to another client."""
+
+
+class JointLeases:
+    """Joint ownership by client id, with expiring leases."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.owners = {}  # joint -> (client, expires)
+
+    def owner(self, joint):
+        entry = self.owners.get(joint)
+        if entry is None or entry[1] <= self.clock():
+            return None
+        return entry[0]
+
+    def acquire(self, client, joints, lease=DEFAULT_LEASE):
+        """Take or renew all of 'joints' for 'client', or none of them."""
+        busy = sorted(joint for joint in joints if self.owner(joint) not in (None, client))
+        if busy:
+            raise JointBusyError(f"joints owned by another client: {', '.join(busy)}")
+        expires = self.clock() + lease
+        for joint in joints:
+            self.owners[joint] = (client, expires)
+
+    def release(self, client, joints=None):
+        """Give up 'joints' (default all) held by 'client'; returns the joints released."""
+        released = [joint for joint, (owner, _) in self.owners.items()
+                    if owner == client and (joints is None or joint in joints)]
+        for joint in released:
+            del self.owners[joint]
+        return released
+
+    def owned(self, client):
+        return sorted(joint for joint in self.owners if self.owner(joint) == client)
+
+
+class ServoBroker:
+    """
+    Serve 'servos' (a hal.ServoBus) and 'imu' (a hal.ImuSource, optional)
+    on a Unix socket at 'path'. 'backend' names the hal backend behind them
+    for clients that record where a measurement came from:
+
+        broker = ServoBroker(open_servo_bus("pigpio"), open_imu("pigpio"), backend="pigpio")
+        asyncio.run(broker.serve())
+    """
+
+    def __init__(self, servos, imu=None, path=DEFAULT_SOCKET, imu_rate=IMU_RATE, clock=time.monotonic,
+                 backend=None):
+        self.servos = servos
+        self.imu = imu
+        self.backend = backend
+        self.path = path
+        self.imu_rate = imu_rate
+        self.leases = JointLeases(clock)
+        self.pin_joints = {pin: joint for joint, pin in servos.servo_pins.items()}
+        self.clients = {}  # id -> name
+        self.sample = None
+        self._new_sample = None
+        self.requests = 0
+        self.frames = 0
+        self._next_client = 1
+        self._server = None
+        self._connections = set()
+        self._servo_executor = ThreadPoolExecutor(1, thread_name_prefix="broker-servo")
+        self._imu_executor = ThreadPoolExecutor(1, thread_name_prefix="broker-imu")
+        self._stopping = None
+
+    # ----- serving -----
+    async def serve(self):
+        """Serve until stop() is called, then release the hardware."""
+        self._stopping = asyncio.Event()
+        self._new_sample = asyncio.Condition()
+        _remove_stale_socket(self.path)
+        self._server = await asyncio.start_unix_server(self._connection, self.path)
+        sampler = asyncio.create_task(self._sample_imu()) if self.imu is not None else None
+        try:
+            await self._stopping.wait()
+        finally:
+            self._server.close()
+            await self._server.wait_closed()
+            tasks = list(self._connections) + ([sampler] if sampler is not None else [])
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._servo_executor.shutdown()
+            self._imu_executor.shutdown()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _sample_imu(self):
+        loop = asyncio.get_running_loop()
+        period = 1.0 / self.imu_rate
+        deadline = loop.time()
+        while True:
+            sample = await loop.run_in_executor(self._imu_executor, self.imu.read_sample)
+            async with self._new_sample:
+                self.sample = sample
+                self._new_sample.notify_all()
+            if self.imu.paced:
+                continue  # the IMU sets the rate
+            deadline = max(deadline + period, loop.time())
+            await asyncio.sleep(deadline - loop.time())
+
+    async def _connection(self, reader, writer):
+        client = self._next_client
+        self._next_client += 1
+        self.clients[client] = f"client {client}"
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(json.dumps(await self._handle(client, line)).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass  # client gone, or the broker is shutting down
+        finally:
+            self._connections.discard(asyncio.current_task())
+            await self._drop(client)
+            writer.close()
+
+    async def _drop(self, client):
+        """Switch off and free the joints of a client that went away."""
+        owned = self.leases.owned(client)
+        self.leases.release(client)
+        self.clients.pop(client, None)
+        if owned:
+            await self._commit({self.servos.servo_pins[joint]: 0 for joint in owned})
+
+    async def _handle(self, client, line):
+        self.requests += 1
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.pop("id", None)
+            handler = getattr(self, "_op_" + request.pop("op", ""), None)
+            if handler is None:
+                raise ValueError("unknown op")
+            return {"id": request_id, "result": await handler(client, **request)}
+        except Exception as error:
+            return {"id": request_id, "error": str(error), "type": type(error).__name__}
+
+    async def _commit(self, pulsewidths):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._servo_executor, self.servos.commit_frame, pulsewidths)
+
+    # ----- operations -----
+    async def _op_hello(self, client, name=None):
+        if name:
+            self.clients[client] = name
+        return {"client": client, "servo_pins": self.servos.servo_pins, "imu": self.imu is not None,
+                "backend": self.backend}
+
+    async def _op_acquire(self, client, joints, lease=DEFAULT_LEASE):
+        unknown = [joint for joint in joints if joint not in self.servos.servo_pins]
+        if unknown:
+            raise ValueError(f"unknown joints: {', '.join(unknown)}")
+        self.leases.acquire(client, joints, lease)
+        return self.leases.owned(client)
+
+    async def _op_release(self, client, joints=None):
+        return self.leases.release(client, joints)
+
+    async def _op_owned(self, client):
+        return self.leases.owned(client)
+
+    async def _op_frame(self, client, pulsewidths, lease=DEFAULT_LEASE):
+        """Commit a {pin: pulsewidth} frame, leasing its joints to the client."""
+        frame = {int(pin): pulsewidth for pin, pulsewidth in pulsewidths.items()}
+        unknown = [pin for pin in frame if pin not in self.pin_joints]
+        if unknown:
+            raise ValueError(f"unknown servo outputs: {unknown}")
+        self.leases.acquire(client, [self.pin_joints[pin] for pin in frame], lease)
+        self.frames += 1
+        return await self._commit(frame)
+
+    async def _op_imu(self, client, after=None):
+        """Newest sample; with 'after', the first one stamped later than that."""
+        if self.imu is None:
+            raise ValueError("this broker has no IMU")
+
+        def fresh():
+            return self.sample is not None and (after is None or self.sample.timestamp > after)
+
+        async with self._new_sample:
+            await asyncio.wait_for(self._new_sample.wait_for(fresh), IMU_TIMEOUT)
+            return list(self.sample)
+
+    async def _op_status(self, client):
+        return {
+            "clients": [{"client": other, "name": name, "joints": self.leases.owned(other)}
+                        for other, name in self.clients.items()],
+            "requests": self.requests,
+            "frames": self.frames,
+            "servo_latency": repr(self.servos.latency),
+        }
+
+
+def _remove_stale_socket(path):
+    """Delete a socket file left by a broker that died; refuse if one is still running."""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise RuntimeError(f"a broker is already listening on {path}")
+    finally:
+        probe.close()
+
+
+# ==========================
+# Clients
+# ==========================
+class BrokerClient:
+    """Blocking connection to a ServoBroker; safe to share between threads."""
+
+    def __init__(self, path=DEFAULT_SOCKET, name=None, timeout=5.0):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(path)
+        except OSError as error:
+            self.sock.close()
+            raise ConnectionError(f"Failed to connect to the servo broker at {path}: {error}") from error
+        self.file = self.sock.makefile("rwb")
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.info = self.call("hello", name=name or os.path.basename(sys.argv[0]))
+
+    def call(self, op, **arguments):
+        return self.batch([dict(arguments, op=op)])[0]
+
+    def batch(self, requests):
+        """Send several {"op": ...} requests in one write; returns their results in order."""
+        with self._lock:
+            ids = []
+            for request in requests:
+                self._next_id += 1
+                ids.append(self._next_id)
+                self.file.write(json.dumps(dict(request, id=self._next_id)).encode() + b"\n")
+            self.file.flush()
+            replies = [json.loads(self.file.readline() or b"null") for _ in ids]
+        results = []
+        for request_id, reply in zip(ids, replies):
+            if reply is None:
+                raise ConnectionError("servo broker closed the connection")
+            if reply.get("id") != request_id:
+                raise ConnectionError(f"reply {reply.get('id')} to request {request_id}")
+            if "error" in reply:
+                raise (JointBusyError if reply["type"] == "JointBusyError" else RuntimeError)(reply["error"])
+            results.append(reply["result"])
+        return results
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class BrokerServoBus(ServoBus):
+    """
+    hal.ServoBus through a ServoBroker. 'joints' are leased up front;
+    otherwise each frame leases the joints it moves. A background thread
+    renews every joint held this way each half lease, so they stay claimed
+    until close() even while no frames are sent (an idle GUI, say).
+    """
+
+    def __init__(self, client=None, joints=None, lease=DEFAULT_LEASE, path=DEFAULT_SOCKET):
+        super().__init__()
+        self.client = client or BrokerClient(path)
+        self.servo_pins = dict(self.client.info["servo_pins"])
+        self.backend = self.client.info.get("backend")  # the broker's own backend
+        self.pin_joints = {pin: joint for joint, pin in self.servo_pins.items()}
+        self.lease = lease
+        self.held = set()
+        self._held_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._keepalive = None
+        if joints:
+            self.client.call("acquire", joints=list(joints), lease=lease)
+            self._hold(joints)
+
+    def _hold(self, joints):
+        with self._held_lock:
+            self.held.update(joints)
+            if self._keepalive is None:
+                self._keepalive = threading.Thread(target=self._renew, name="broker-lease", daemon=True)
+                self._keepalive.start()
+
+    def _renew(self):
+        while not self._closing.wait(self.lease / 2):
+            with self._held_lock:
+                joints = sorted(self.held)
+            try:
+                self.client.call("acquire", joints=joints, lease=self.lease)
+            except JointBusyError:
+                continue  # taken while a renewal was late; claim them again once free
+            except (ConnectionError, OSError):
+                return
+
+    def _commit(self, pulsewidths):
+        frame = {str(pin): int(pulsewidth) for pin, pulsewidth in pulsewidths.items()}
+        sent = self.client.call("frame", pulsewidths=frame, lease=self.lease)
+        self._hold(self.pin_joints[pin] for pin in pulsewidths)
+        return sent
+
+    def off(self):
+        """Switch off the joints this client owns."""
+        owned = self.client.call("owned")
+        if owned:
+            self.commit_frame({self.servo_pins[joint]: 0 for joint in owned})
+
+    def close(self):
+        self._closing.set()
+        if self._keepalive is not None:
+            self._keepalive.join()
+        self.off()
+        self.client.call("release")
+        self.client.close()
+
+
+class BrokerImuSource(ImuSource):
+    """
+    hal.ImuSource returning the broker's newest MPU6050 sample, waiting for
+    one newer than the last it returned, so reads follow the broker's rate.
+    """
+
+    paced = True
+
+    def __init__(self, client=None, path=DEFAULT_SOCKET):
+        super().__init__()
+        self.client = client or BrokerClient(path)
+        self.timestamp = None
+
+    def _read(self):
+        sample = ImuSample(*self.client.call("imu", after=self.timestamp))
+        self.timestamp = sample.timestamp
+        return sample
+
+    def close(self):
+        self.client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Own the servos and IMU and share them over a Unix socket")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    parser.add_argument("--no-imu", action="store_true")
+    args, _ = parser.parse_known_args(argv)
+    backend = select_backend(argv)
+    if backend == "broker":
+        raise ValueError("the broker needs a hardware or simulator backend")
+
+    servos = open_servo_bus(backend)
+    imu = None if args.no_imu else open_imu(backend)
+    broker = ServoBroker(servos, imu, args.socket, backend=backend)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, broker.stop)
+        print(f"Servo broker on {args.socket} ({backend})")
+        await broker.serve()
+
+    try:
+        asyncio.run(run())
+    finally:
+        servos.close()
+        if imu is not None:
+            imu.close()
+        print("Broker stopped, servos off.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import time
+
+# ==========================
+# Change-only Servo Output
+# ==========================
+# Every set_servo_pulsewidth() on a pigpio.pi is a socket round trip to the
+# daemon. ServoOutput sits in front of it, remembers the last pulsewidth sent
+# to each pin and only forwards real changes.
+#
+# commit_frame() goes one step further for whole poses: it stores a small
+# script in the daemon ("servo 23 p0 servo 22 p1 ...") once per set of pins, then
+# each pose is a single run_script() call carrying every pulsewidth as a
+# parameter. The daemon applies them back to back, microseconds apart, so
+# all joints switch in the same 20 ms servo frame.
+
+# pigpio scripts take at most 10 parameters (p0..p9)
+SCRIPT_MAX_PINS = 10
+PI_SCRIPT_INITING = 0  # pigpio.PI_SCRIPT_INITING
+
+
+class ServoOutput:
+    """
+    Drop-in for pi.set_servo_pulsewidth() that skips redundant writes.
+
+    'deadband' (µs) also suppresses changes smaller than that, which hides
+    rounding noise from interpolated or feedback-driven poses. Switching a
+    servo off (0) or back on is always sent.
+    """
+
+    def __init__(self, pi, deadband=0):
+        self.pi = pi
+        self.deadband = deadband
+        self.last_pulsewidth = {}
+        self.writes = 0
+        self.suppressed = 0
+        self.frames = 0
+        self._scripts = {}
+
+    def set_servo_pulsewidth(self, pin, pulsewidth):
+        """Send 'pulsewidth' to 'pin' unless it is already there. Returns True if sent."""
+        pulsewidth = int(pulsewidth)  # pigpio truncates to whole microseconds anyway
+        if not self._changed(pin, pulsewidth):
+            self.suppressed += 1
+            return False
+        self.pi.set_servo_pulsewidth(pin, pulsewidth)
+        self.last_pulsewidth[pin] = pulsewidth
+        self.writes += 1
+        return True
+
+    def commit_frame(self, pulsewidths):
+        """
+        Apply a {pin: pulsewidth} pose in one daemon round trip.
+        Skipped entirely when no pin moved by at least the deadband;
+        otherwise the stored script sets every pin in the frame, and each
+        one counts as a write. Returns True if the frame was sent.
+        """
+        frame = {pin: int(pulsewidth) for pin, pulsewidth in pulsewidths.items()}
+        changed = [pin for pin, pulsewidth in frame.items() if self._changed(pin, pulsewidth)]
+        if not changed:
+            self.suppressed += len(frame)
+            return False
+
+        pins = tuple(sorted(frame))
+        for start in range(0, len(pins), SCRIPT_MAX_PINS):
+            chunk = pins[start:start + SCRIPT_MAX_PINS]
+            self.pi.run_script(self._script_for(chunk), [frame[pin] for pin in chunk])
+        self.last_pulsewidth.update(frame)
+        self.writes += len(frame)
+        self.frames += 1
+        return True
+
+    def close(self):
+        """Delete the daemon-side frame scripts."""
+        for script_id in self._scripts.values():
+            self.pi.delete_script(script_id)
+        self._scripts.clear()
+
+    def _changed(self, pin, pulsewidth):
+        last = self.last_pulsewidth.get(pin)
+        if last is None or last == 0 or pulsewidth == 0:
+            return last != pulsewidth
+        return abs(pulsewidth - last) >= max(self.deadband, 1)
+
+    def _script_for(self, pins):
+        script_id = self._scripts.get(pins)
+        if script_id is None:
+            text = " ".join(f"servo {pin} p{i}" for i, pin in enumerate(pins))
+            script_id = self.pi.store_script(text.encode())
+            # A freshly stored script is compiled asynchronously by the daemon
+            while self.pi.script_status(script_id)[0] == PI_SCRIPT_INITING:
+                time.sleep(0.001)
+            self._scripts[pins] = script_id
+        return script_id
+
+    def forget(self, pin=None):
+        """Drop the cached value for 'pin' (or all pins) so the next write is always sent."""
+        if pin is None:
+            self.last_pulsewidth.clear()
+        else:
+            self.last_pulsewidth.pop(pin, None)
+
+    def stats(self):
+        total = self.writes + self.suppressed
+        return {
+            "writes": self.writes,
+            "suppressed": self.suppressed,
+            "frames": self.frames,
+            "suppressed_ratio": self.suppressed / total if total else 0.0,
+        }
@@ -0,0 +1,109 @@
+from collections import namedtuple
+
+import numpy as np
+
+from kinematics import FOOT_WIDTH, LEGS, leg_points, servo_to_leg
+from trajectory import JOINT_ORDER, compile_keyframes, keyframes_to_array
+
+# ==========================
+# Static Stability
+# ==========================
+# Forward kinematics of the whole robot: where the centre of mass projects
+# onto the floor relative to the support region of the two feet, for every
+# frame of a pose array at once. A pattern whose centre of mass leaves the
+# support region at any frame will tip the robot over, so it can be
+# rejected before it is tried on the hardware.
+#
+# Both feet are treated as on the floor, as in biped_sim.py: the body
+# pitches so the feet sit flat on average and rolls toward the shorter leg
+# until both touch. The support region is the bounding box of the soles.
+
+# Masses in kg and torso centre of mass height above the hips
+TORSO_MASS = 0.60
+TORSO_COM_HEIGHT = 0.06
+THIGH_MASS = 0.06
+SHIN_MASS = 0.06
+FOOT_MASS = 0.04
+LEG_MASS = THIGH_MASS + SHIN_MASS + FOOT_MASS
+TOTAL_MASS = TORSO_MASS + 2 * LEG_MASS
+
+# Control rate patterns are sampled at for check_pattern()
+CHECK_RATE = 50
+
+# Per-frame arrays; horizontal positions relative to the hips, heights above
+# the floor, angles in radians (pitch positive nose up, roll positive left side up)
+PoseGeometry = namedtuple("PoseGeometry", "com_x com_y com_height x_min x_max y_min y_max pitch roll")
+
+
+def pose_array(poses):
+    """(N, 6) servo degrees in JOINT_ORDER from a pose dict, a list of them or an array."""
+    if isinstance(poses, dict):
+        return keyframes_to_array([poses])
+    if isinstance(poses, (list, tuple)) and poses and isinstance(poses[0], dict):
+        return keyframes_to_array(poses)
+    return np.atleast_2d(np.asarray(poses, dtype=float))
+
+
+def pose_geometry_batch(poses):
+    """Centre of mass and support region of every frame, as a PoseGeometry of (N,) arrays."""
+    columns = dict(zip(JOINT_ORDER, pose_array(poses).T))
+    com_x = 0.0
+    com_y = 0.0
+    com_z = TORSO_MASS * TORSO_COM_HEIGHT
+    feet = []
+    for side, (hip_y, *_) in LEGS.items():
+        (kx, kz), (ax, az), toe, heel, foot_pitch = leg_points(*servo_to_leg(side, columns))
+        com_x = com_x + THIGH_MASS * kx / 2 + SHIN_MASS * (kx + ax) / 2 + FOOT_MASS * ax
+        com_z = com_z + THIGH_MASS * kz / 2 + SHIN_MASS * (kz + az) / 2 + FOOT_MASS * az
+        com_y = com_y + LEG_MASS * hip_y
+        feet.append((hip_y, np.stack((toe[0], heel[0]), -1), np.stack((toe[1], heel[1]), -1), foot_pitch))
+    com_x, com_y, com_z = com_x / TOTAL_MASS, com_y / TOTAL_MASS, com_z / TOTAL_MASS
+
+    # Pitch the body (rotating x toward z) so the feet are flat on average
+    pitch = -(feet[0][3] + feet[1][3]) / 2
+    cos_p, sin_p = np.cos(pitch)[:, None], np.sin(pitch)[:, None]
+    soles = [(hip_y, x * cos_p - z * sin_p, x * sin_p + z * cos_p) for hip_y, x, z, _ in feet]
+
+    # Roll until the lowest points of both soles are level
+    (left_y, _, left_z), (right_y, _, right_z) = soles
+    roll = np.arctan2(right_z.min(axis=1) - left_z.min(axis=1), left_y - right_y)
+    cos_r, sin_r = np.cos(roll), np.sin(roll)
+
+    com_x, com_z = com_x * cos_p[:, 0] - com_z * sin_p[:, 0], com_x * sin_p[:, 0] + com_z * cos_p[:, 0]
+    com_y, com_z = com_y * cos_r - com_z * sin_r, com_y * sin_r + com_z * cos_r
+
+    xs, ys, zs = [], [], []
+    for hip_y, x, z in soles:
+        for y in (hip_y - FOOT_WIDTH / 2, hip_y + FOOT_WIDTH / 2):
+            xs.append(x)
+            ys.append(y * cos_r[:, None] - z * sin_r[:, None])
+            zs.append(y * sin_r[:, None] + z * cos_r[:, None])
+    xs, ys, zs = np.hstack(xs), np.hstack(ys), np.hstack(zs)
+    return PoseGeometry(com_x, com_y, com_z - zs.min(axis=1), xs.min(axis=1), xs.max(axis=1),
+                        ys.min(axis=1), ys.max(axis=1), pitch, roll)
+
+
+def support_margin(geometry):
+    """Distance in metres from the projected centre of mass to the nearest support edge (negative outside)."""
+    return np.minimum.reduce((geometry.com_x - geometry.x_min, geometry.x_max - geometry.com_x,
+                              geometry.com_y - geometry.y_min, geometry.y_max - geometry.com_y))
+
+
+def check_stability(poses, min_margin=0.0):
+    """
+    Static check of every frame. Returns (stable, margins, worst frame index),
+    'stable' being True when every margin is at least 'min_margin' metres.
+    """
+    margins = support_margin(pose_geometry_batch(poses))
+    worst = int(np.argmin(margins))
+    return bool(margins[worst] >= min_margin), margins, worst
+
+
+def check_pattern(pattern, base_position, min_margin=0.0, rate=CHECK_RATE):
+    """
+    check_stability() for a cycle_mpu.py-style pattern: from 'base_position'
+    through every step and back, including the poses in between.
+    """
+    keyframes = [base_position] + list(pattern) + [base_position]
+    trajectory = compile_keyframes(keyframes, 1.0, rate, start=base_position)
+    return check_stability(trajectory.angles, min_margin)
@@ -0,0 +1,173 @@
+import math
+import threading
+from collections import deque, namedtuple
+
+from fusion import ComplementaryFilter
+from scheduler import RateScheduler
+
+# ==========================
+# Streaming Stability Monitor
+# ==========================
+# Running statistics of the IMU stream over several sliding time windows,
+# readable at any moment without waiting for new samples. Every window keeps
+# a Welford mean/variance that is updated as samples enter and leave, plus
+# monotonic min/max queues for the peak-to-peak, so each sample costs O(1)
+# whatever the window length.
+#
+# Feed it with update() from code that already reads the IMU (the balance
+# loop does), or let start() sample the IMU on its own thread. Callables in
+# 'listeners' get every (sample, pitch, roll) first, e.g. a fall detector.
+
+DEFAULT_WINDOWS = (0.1, 1.0, 10.0)  # seconds
+SAMPLE_RATE = 200  # Hz, for start()
+
+CHANNELS = ("pitch", "roll", "abs_pitch", "abs_roll", "gyro")
+
+# Snapshot of one window: sample count, then per channel (mean, std, peak-to-peak, rms)
+WindowStats = namedtuple("WindowStats", "samples pitch roll abs_pitch abs_roll gyro")
+ChannelStats = namedtuple("ChannelStats", "mean std peak_to_peak rms")
+
+
+class SlidingWindow:
+    """Mean, variance, RMS and peak-to-peak of one signal over the last 'span' seconds."""
+
+    def __init__(self, span):
+        self.span = span
+        self.samples = deque()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self._min = deque()
+        self._max = deque()
+
+    def add(self, timestamp, value):
+        self.samples.append((timestamp, value))
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((timestamp, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((timestamp, value))
+
+        cutoff = timestamp - self.span
+        while self.samples[0][0] <= cutoff:
+            self._remove(self.samples.popleft()[1])
+        while self._min[0][0] <= cutoff:
+            self._min.popleft()
+        while self._max[0][0] <= cutoff:
+            self._max.popleft()
+
+    def _remove(self, value):
+        self.count -= 1
+        if self.count == 0:
+            self.mean = self.m2 = 0.0
+        else:
+            delta = value - self.mean
+            self.mean -= delta / self.count
+            self.m2 = max(0.0, self.m2 - delta * (value - self.mean))
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def rms(self):
+        return math.sqrt(self.m2 / self.count + self.mean * self.mean) if self.count else 0.0
+
+    @property
+    def peak_to_peak(self):
+        return self._max[0][1] - self._min[0][1] if self.count else 0.0
+
+    def stats(self):
+        return ChannelStats(self.mean, math.sqrt(self.variance), self.peak_to_peak, self.rms)
+
+
+class StabilityMonitor:
+    """
+    Pitch, roll (signed and absolute, in degrees) and gyro rate magnitude
+    (°/s) over each of 'windows' seconds.
+
+        monitor = StabilityMonitor()
+        monitor.start(imu)                 # or monitor.update(sample) per sample
+        pitch_dev, roll_dev = monitor.deviation(1.0)
+        print(monitor.stats(0.1).gyro.rms)
+    """
+
+    def __init__(self, windows=DEFAULT_WINDOWS, alpha=0.98):
+        self.filter = ComplementaryFilter(alpha)
+        self.windows = {span: {channel: SlidingWindow(span) for channel in CHANNELS} for span in windows}
+        self.pitch = None
+        self.roll = None
+        self.samples = 0
+        self.timestamp = None
+        self.listeners = []
+        self.scheduler = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def update(self, sample, pitch=None, roll=None):
+        """
+        Add one ImuSample; pass 'pitch'/'roll' if the caller already fused them.
+        The same sample again (equal timestamp) is ignored.
+        """
+        if sample.timestamp == self.timestamp:
+            return
+        self.timestamp = sample.timestamp
+        if pitch is None:
+            pitch, roll = self.filter.update(sample)
+        self.pitch, self.roll = pitch, roll
+        for listener in self.listeners:
+            listener(sample, pitch, roll)
+        values = (pitch, roll, abs(pitch), abs(roll), math.hypot(sample.gx, sample.gy))
+        timestamp = sample.timestamp
+        for channels in self.windows.values():
+            for window, value in zip(channels.values(), values):
+                window.add(timestamp, value)
+        self.samples += 1
+
+    def stats(self, span):
+        """WindowStats of the window of 'span' seconds."""
+        channels = self.windows[span]
+        return WindowStats(channels["pitch"].count, *(channels[channel].stats() for channel in CHANNELS))
+
+    def deviation(self, span):
+        """Mean |pitch| and |roll| over the window, like cycle_mpu.py's measure_stability()."""
+        channels = self.windows[span]
+        return channels["abs_pitch"].mean, channels["abs_roll"].mean
+
+    # ----- own sampling thread -----
+    def start(self, imu, rate=SAMPLE_RATE):
+        """
+        Read 'imu' at 'rate' Hz on a daemon thread; a paced IMU (hal.ImuSource.paced,
+        e.g. interrupt-driven) is read at the rate it delivers samples instead.
+        """
+        self._stopping.clear()
+        if imu.paced:
+            self.scheduler = None
+            target = self._follow
+            args = (imu,)
+        else:
+            self.scheduler = RateScheduler()
+            self.scheduler.add_task("stability monitor", 1.0 / rate, lambda: self.update(imu.read_sample()))
+            target = self.scheduler.run
+            args = ()
+        self._thread = threading.Thread(target=target, args=args, kwargs={"stop": self._stopping.is_set},
+                                        daemon=True)
+        self._thread.start()
+
+    def _follow(self, imu, stop):
+        while not stop():
+            self.update(imu.read_sample())
+
+    def stop(self):
+        self._stopping.set()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,29 +1,28 @@
-import pigpio
 import tkinter as tk
 from tkinter import messagebox
 from tkinter import ttk
-import time
-import threading
+import itertools
+
+from calibration import load_calibration
+from hal import open_servo_bus
+from runtime import ControlRuntime
+from gait_cache import compile_gait
 
 # ----------------------------
-# 1. PIGPIO INITIALIZATION
+# 1. SERVO BACKEND INITIALIZATION
 # ----------------------------
-pi = pigpio.pi()
-if not pi.connected:
-    print("Failed to connect to pigpio daemon")
+try:
+    servos = open_servo_bus()  # pigpio unless --backend or ROBOT_BACKEND picks pca9685 or sim
+except ConnectionError as e:
+    print(e)
     exit()
 
 # ----------------------------
 # 2. SERVO PINS AND POSITIONS
 # ----------------------------
-servo_pins = {
-    "Hip Left": 23,
-    "Knee Left": 22,
-    "Hip Right": 27,
-    "Knee Right": 17,  # Physically reversed
-    "Left Toe": 16,
-    "Right Toe": 26,   # Physically reversed
-}
+# Angle -> pulsewidth per joint, including Right Toe's reversal (calibration.py)
+servo_pins = servos.servo_pins
+calibration = load_calibration()
 
 natural_standing_position = {
     "Hip Left": 90,
@@ -64,44 +63,27 @@ def generate_large_stride_cycle():
 
 walking_cycle = generate_large_stride_cycle()
 
+# The walk is compiled once into a (frames x joints) array of pulsewidths at
+# the control rate and cached in .gait_cache, so later runs just map the file
+# and the loop below only steps through precomputed rows.
+CONTROL_RATE = 50     # Hz
+SEGMENT_TIME = 0.75   # s between keyframes (5 substeps of 0.15 s before)
+walking_gait = compile_gait(walking_cycle, SEGMENT_TIME, CONTROL_RATE, profile="linear",
+                            calibration=calibration)
+walking_pins = [servo_pins[joint] for joint in walking_gait.joints]
+walking_frames = [dict(zip(walking_pins, row)) for row in walking_gait.frames.tolist()]
 
-walking = False
-walking_thread = None
+walker = None  # ControlRuntime playing walking_frames while the cycle runs
 
 # ----------------------------
 # 3. SERVO HELPER FUNCTIONS
 # ----------------------------
-def set_servo_angle(pin, angle, reverse=False):
-    """Move the servo on 'pin' to 'angle'. If reverse=True, invert the angle."""
+def move_all_servos(angles):
+    """Move every servo in the same PWM frame."""
     try:
-        if reverse:
-            angle = 180 - angle
-        pulsewidth = 500 + (angle / 180.0) * 2000
-        pulsewidth = max(500, min(2500, pulsewidth))  # clamp to [500..2500]
-        pi.set_servo_pulsewidth(pin, pulsewidth)
+        servos.commit_frame(calibration.frame(angles, servo_pins))  # one round trip per pose, only when it changed
     except Exception as e:
-        print(f"Error setting servo angle: {e}")
-
-def move_all_servos(angles):
-    """Move each servo to the specified angle; reverse Right Knee and Right Toe."""
-    for joint, angle in angles.items():
-        reverse = (joint == "Right Knee" or joint == "Right Toe")
-        set_servo_angle(servo_pins[joint], angle, reverse)
-        time.sleep(0.05)  # Small delay between servo movements
-
-def interpolate_positions(start, end, steps):
-    """
-    Interpolates between start and end positions over the specified number of steps.
-    Returns a list of intermediate positions.
-    """
-    interpolated_positions = []
-    for step in range(steps):
-        intermediate = {
-            joint: start[joint] + (end[joint] - start[joint]) * step / steps
-            for joint in start
-        }
-        interpolated_positions.append(intermediate)
-    return interpolated_positions
+        print(f"Error setting servo angles: {e}")
 
 # ----------------------------
 # 4. RESET & WALKING FUNCTIONS
@@ -111,40 +93,21 @@ def reset_to_natural_position():
     move_all_servos(natural_standing_position)
     messagebox.showinfo("Reset", "Robot reset to natural position.")
 
-def execute_walking_cycle():
-    """Execute the walking cycle with extended leg movements."""
-    global walking
-    try:
-        while walking:
-            for i in range(len(walking_cycle) - 1):
-                start = walking_cycle[i]
-                end = walking_cycle[i + 1]
-                interpolated_positions = interpolate_positions(start, end, steps=5)
-                for position in interpolated_positions:
-                    if not walking:
-                        break
-                    move_all_servos(position)
-                    time.sleep(0.15)  # Slightly faster transition
-    except Exception as e:
-        print(f"Error during walking cycle: {e}")
-    finally:
-        reset_to_natural_position()
-
-
-
-
 def start_cycle():
-    """Start the walking cycle in a separate thread."""
-    global walking, walking_thread
-    if not walking:
-        walking = True
-        walking_thread = threading.Thread(target=execute_walking_cycle, daemon=True)
-        walking_thread.start()
+    """Start playing the walking cycle in the background."""
+    global walker
+    if walker is None:
+        frames = itertools.cycle(walking_frames)
+        walker = ControlRuntime(None, lambda sample: next(frames), servos.commit_frame, rate=CONTROL_RATE)
+        walker.start()
 
 def stop_cycle():
-    """Stop the walking cycle."""
-    global walking
-    walking = False
+    """Stop the walking cycle and stand back up."""
+    global walker
+    if walker is not None:
+        walker.stop()  # returns after the last frame went out
+        walker = None
+        reset_to_natural_position()
 
 # ----------------------------
 # 5. TKINTER GUI SETUP
@@ -165,13 +128,9 @@ ttk.Button(main_frame, text="Reset to Natural Position", command=reset_to_natura
 # 6. CLEANUP ON EXIT
 # ----------------------------
 def on_close():
-    """Ensure servos are turned off and pigpio is cleaned up on exit."""
+    """Ensure servos are turned off and the backend is cleaned up on exit."""
     stop_cycle()
-    if walking_thread:
-        walking_thread.join()
-    for pin in servo_pins.values():
-        pi.set_servo_pulsewidth(pin, 0)
-    pi.stop()
+    servos.close()
     root.destroy()
 
 root.protocol("WM_DELETE_WINDOW", on_close)
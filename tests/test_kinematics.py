@@ -0,0 +1,51 @@
+import unittest
+
+import numpy as np
+
+from calibration import Calibration
+from kinematics import (NATURAL_STANDING_POSITION, STANDING_FOOT_HEIGHT, foot_position, servo_to_leg,
+                        solve_pose, solve_pose_batch)
+from trajectory import JOINT_ORDER
+
+STANDING = (0.0, STANDING_FOOT_HEIGHT)
+
+
+class SolvePoseTest(unittest.TestCase):
+    def test_standing_feet_give_the_natural_pose(self):
+        angles = solve_pose(STANDING, STANDING)
+        for joint, angle in NATURAL_STANDING_POSITION.items():
+            self.assertAlmostEqual(angles[joint], angle, places=3)
+
+    def test_solution_reproduces_the_foot_position(self):
+        angles = solve_pose((0.01, -0.15), STANDING)
+        x, z, _ = foot_position(*servo_to_leg("Left", angles))
+        self.assertAlmostEqual(float(x), 0.01, places=3)
+        self.assertAlmostEqual(float(z), -0.15, places=3)
+
+    def test_out_of_reach_foot_raises(self):
+        with self.assertRaises(ValueError):
+            solve_pose((0.0, -0.3), STANDING)
+
+    def test_servo_limits_make_a_reachable_knee_unreachable(self):
+        # The knee can fold this far, but Knee Right would need about -2°
+        # (and Knee Left, folding the other way, about 182°)
+        target = (0.0, -0.14)
+        angles, reachable = solve_pose_batch(np.array([STANDING, STANDING]), np.array([target, STANDING]))
+        self.assertLess(angles[0, JOINT_ORDER.index("Knee Right")], 0.0)
+        self.assertEqual(reachable.tolist(), [False, True])
+        with self.assertRaises(ValueError):
+            solve_pose(STANDING, target)
+        with self.assertRaises(ValueError):
+            solve_pose(target, STANDING)
+
+    def test_calibration_limits(self):
+        # Toes up 0.7 rad needs the toe servos at about 170°, past their 160° limit
+        raised = (0.0, STANDING_FOOT_HEIGHT + 0.01)
+        _, free = solve_pose_batch(raised, raised, foot_pitch=0.7)
+        _, limited = solve_pose_batch(raised, raised, foot_pitch=0.7, calibration=Calibration())
+        self.assertTrue(free)
+        self.assertFalse(limited)
+
+
+if __name__ == "__main__":
+    unittest.main()
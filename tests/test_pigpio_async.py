@@ -0,0 +1,73 @@
+import asyncio
+import time
+import unittest
+
+from pigpio_async import (CMD_SERVO, PI_BAD_PULSEWIDTH, PI_BAD_USER_GPIO, RESPONSE, AsyncPigpio,
+                          FakePigpioDaemon, PigpioError)
+
+# Run from the repository root: python -m unittest discover tests
+
+SERVO_PINS = {"Hip Left": 23, "Knee Left": 22, "Hip Right": 27, "Knee Right": 17, "Left Toe": 5, "Right Toe": 6}
+
+
+class PipeliningTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.daemon = await FakePigpioDaemon(reply_delay=0.02).start()
+        self.pi = await AsyncPigpio(port=self.daemon.port).connect()
+
+    async def asyncTearDown(self):
+        await self.pi.close()
+        await self.daemon.stop()
+
+    async def test_frame_costs_one_round_trip(self):
+        frame = {pin: 1000 + 100 * i for i, pin in enumerate(SERVO_PINS.values())}
+        start = time.perf_counter()
+        await self.pi.commit_frame(frame)
+        elapsed = time.perf_counter() - start
+        # Six sequential commands would take at least 6 * 20 ms
+        self.assertLess(elapsed, 3 * self.daemon.reply_delay)
+        self.assertEqual(self.daemon.servos, frame)
+        self.assertEqual(self.daemon.log, [(CMD_SERVO, pin, width) for pin, width in frame.items()])
+
+    async def test_replies_are_matched_in_order(self):
+        await self.pi.commit_frame({pin: 500 + 50 * pin for pin in SERVO_PINS.values()})
+        # Requests from many tasks at once each get their own reply
+        widths = await asyncio.gather(*(self.pi.get_servo_pulsewidth(pin) for pin in SERVO_PINS.values()))
+        self.assertEqual(widths, [500 + 50 * pin for pin in SERVO_PINS.values()])
+
+    async def test_errors_fail_only_their_request(self):
+        results = await asyncio.gather(self.pi.set_servo_pulsewidth(23, 1500),
+                                       self.pi.set_servo_pulsewidth(22, 3000),
+                                       self.pi.set_servo_pulsewidth(40, 1500),
+                                       self.pi.get_servo_pulsewidth(23),
+                                       return_exceptions=True)
+        self.assertEqual(results[0], 0)
+        self.assertIsInstance(results[1], PigpioError)
+        self.assertEqual(results[1].code, PI_BAD_PULSEWIDTH)
+        self.assertIsInstance(results[2], PigpioError)
+        self.assertEqual(results[2].code, PI_BAD_USER_GPIO)
+        self.assertEqual(results[3], 1500)
+
+
+class UnexpectedReplyTest(unittest.IsolatedAsyncioTestCase):
+    async def test_unsolicited_reply_closes_the_client(self):
+        async def serve(reader, writer):
+            writer.write(RESPONSE.pack(CMD_SERVO, 0, 0, 0))  # a reply nobody asked for
+            await reader.read()
+            writer.close()
+
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        pi = await AsyncPigpio(port=server.sockets[0].getsockname()[1]).connect()
+        try:
+            await asyncio.wait_for(asyncio.shield(pi._receiver), 1.0)
+            self.assertFalse(pi.connected)
+            with self.assertRaises(ConnectionError):
+                await pi.set_servo_pulsewidth(23, 1500)
+        finally:
+            await pi.close()
+            server.close()
+            await server.wait_closed()
+
+
+if __name__ == "__main__":
+    unittest.main()
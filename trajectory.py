@@ -0,0 +1,180 @@
+import numpy as np
+
+# ==========================
+# Trajectory Engine
+# ==========================
+# Compiles a list of keyframe poses (joint -> angle dicts, as used by the
+# walking cycles) into one NumPy array of joint angles sampled at the control
+# rate. The whole cycle is computed once up front; the control loop then only
+# indexes rows.
+
+JOINT_ORDER = ("Hip Left", "Knee Left", "Hip Right", "Knee Right", "Left Toe", "Right Toe")
+
+PROFILES = ("linear", "cubic", "minjerk")
+
+# Velocity/acceleration limits are met by stretching segments; stop after this many passes
+LIMIT_PASSES = 20
+
+
+class Trajectory:
+    """
+    Joint angles sampled at 'rate' Hz: 'angles' is an (N, len(joints)) array
+    in degrees and 'times' the matching (N,) sample times in seconds.
+    """
+
+    def __init__(self, angles, joints, rate, durations, loop):
+        self.angles = angles
+        self.joints = tuple(joints)
+        self.rate = rate
+        self.durations = durations
+        self.loop = loop
+        self.times = np.arange(len(angles)) / rate
+
+    def __len__(self):
+        return len(self.angles)
+
+    @property
+    def duration(self):
+        return float(np.sum(self.durations))
+
+    def pose(self, index):
+        """Row 'index' as a joint -> angle dict."""
+        return dict(zip(self.joints, self.angles[index].tolist()))
+
+    def velocities(self):
+        """Finite-difference joint velocities in °/s."""
+        return np.gradient(self.angles, 1.0 / self.rate, axis=0) if len(self) > 1 else np.zeros_like(self.angles)
+
+    def pulsewidths(self, calibration):
+        """Whole trajectory as an (N, J) array of servo pulsewidths from a calibration.Calibration."""
+        return calibration.pulsewidths(self.angles, self.joints)
+
+
+def keyframes_to_array(keyframes, joints=JOINT_ORDER, start=None):
+    """
+    (K, J) array from joint -> angle dicts. Joints a keyframe leaves out keep
+    their previous value, starting from 'start' (or the first keyframe).
+    """
+    current = dict(start or {})
+    rows = []
+    for keyframe in keyframes:
+        current.update(keyframe)
+        missing = [joint for joint in joints if joint not in current]
+        if missing:
+            raise ValueError(f"no angle for {', '.join(missing)}; pass start= to fill them")
+        rows.append([current[joint] for joint in joints])
+    return np.array(rows, dtype=float)
+
+
+def compile_keyframes(keyframes, segment_time, rate, profile="linear", joints=JOINT_ORDER,
+                      velocity_limits=None, acceleration_limits=None, loop=False, start=None):
+    """
+    Sample the motion through 'keyframes' at 'rate' Hz.
+
+    segment_time: seconds between keyframes (scalar, or one per segment).
+    profile: "linear", "cubic" (C2 spline through all keyframes, periodic
+        when looping) or "minjerk" (zero velocity and acceleration at each keyframe).
+    velocity_limits / acceleration_limits: per-joint °/s and °/s² as a
+        joint -> limit dict or a sequence in 'joints' order. Segments that
+        would exceed them are slowed down; ValueError if that does not get
+        within them. The linear profile changes velocity in one step at every
+        keyframe, so it takes no acceleration limits.
+    loop: also move from the last keyframe back to the first, and leave the
+        repeated first pose off the end so the array can be played cyclically.
+    """
+    if profile not in PROFILES:
+        raise ValueError(f"unknown profile {profile!r}, expected one of {', '.join(PROFILES)}")
+    if profile == "linear" and acceleration_limits is not None:
+        raise ValueError('acceleration_limits need the "cubic" or "minjerk" profile')
+    points = keyframes_to_array(keyframes, joints, start)
+    if loop:
+        points = np.vstack((points, points[:1]))
+    segments = len(points) - 1
+    if segments < 1:
+        raise ValueError("need at least two keyframes (or one with loop=True)")
+
+    durations = np.broadcast_to(np.asarray(segment_time, dtype=float), (segments,)).copy()
+    v_max = _limits(velocity_limits, joints)
+    a_max = _limits(acceleration_limits, joints)
+
+    for _ in range(LIMIT_PASSES):
+        angles, segment_index = _sample(points, durations, rate, profile, loop)
+        scale = _limit_scale(angles, segment_index, segments, rate, v_max, a_max)
+        if np.all(scale <= 1.0 + 1e-6):
+            break
+        durations *= np.maximum(scale, 1.0) * 1.01
+    else:
+        raise ValueError(f"velocity/acceleration limits still exceeded after {LIMIT_PASSES} passes "
+                         f"(by up to {float(np.max(scale)):.2f}x)")
+    return Trajectory(angles, joints, rate, durations, loop)
+
+
+def _limits(limits, joints):
+    if limits is None:
+        return None
+    if isinstance(limits, dict):
+        return np.array([limits.get(joint, np.inf) for joint in joints], dtype=float)
+    return np.broadcast_to(np.asarray(limits, dtype=float), (len(joints),))
+
+
+def _sample(points, durations, rate, profile, loop):
+    knots = np.concatenate(([0.0], np.cumsum(durations)))
+    count = int(round(knots[-1] * rate))
+    t = np.arange(count if loop else count + 1) / rate
+    index = np.clip(np.searchsorted(knots, t, side="right") - 1, 0, len(durations) - 1)
+    s = np.clip((t - knots[index]) / durations[index], 0.0, 1.0)
+
+    if profile == "cubic":
+        return _cubic_spline(points, knots, t, index, loop), index
+    if profile == "minjerk":
+        s = s ** 3 * (10 - 15 * s + 6 * s * s)
+    start = points[index]
+    return start + (points[index + 1] - start) * s[:, None], index
+
+
+def _cubic_spline(points, knots, t, index, loop):
+    """Natural (or periodic, when looping) cubic spline evaluated at 't'."""
+    n = len(points)
+    h = np.diff(knots)
+    slopes = np.diff(points, axis=0) / h[:, None]
+    # Solve for the second derivatives m at every knot
+    A = np.zeros((n, n))
+    rhs = np.zeros_like(points)
+    for i in range(1, n - 1):
+        A[i, i - 1:i + 2] = h[i - 1], 2 * (h[i - 1] + h[i]), h[i]
+        rhs[i] = 6 * (slopes[i] - slopes[i - 1])
+    if loop and n > 2:
+        # The first and last knots are the same pose: match slope and curvature there
+        A[0, 0], A[0, 1], A[0, n - 2] = 2 * (h[-1] + h[0]), h[0], h[-1]
+        rhs[0] = 6 * (slopes[0] - slopes[-1])
+        A[n - 1, 0], A[n - 1, n - 1] = 1.0, -1.0
+    else:
+        A[0, 0] = A[n - 1, n - 1] = 1.0
+    m = np.linalg.solve(A, rhs)
+
+    dt = (t - knots[index])[:, None]
+    hi = h[index][:, None]
+    m0, m1 = m[index], m[index + 1]
+    p0, p1 = points[index], points[index + 1]
+    b = (p1 - p0) / hi - hi * (2 * m0 + m1) / 6
+    return p0 + dt * (b + dt * (m0 / 2 + dt * (m1 - m0) / (6 * hi)))
+
+
+def _limit_scale(angles, segment_index, segments, rate, v_max, a_max):
+    """How much each segment must be stretched to respect the limits."""
+    scale = np.ones(segments)
+    if (v_max is None and a_max is None) or len(angles) < 3:
+        return scale
+    velocity = np.gradient(angles, 1.0 / rate, axis=0)
+    checks = []
+    if v_max is not None:
+        checks.append((np.abs(velocity) / v_max, 1.0))
+    if a_max is not None:
+        acceleration = np.gradient(velocity, 1.0 / rate, axis=0)
+        checks.append((np.abs(acceleration) / a_max, 0.5))  # acceleration scales with time squared
+    for ratio, power in checks:
+        worst = ratio.max(axis=1)
+        per_segment = np.zeros(segments)
+        np.maximum.at(per_segment, segment_index, worst)
+        scale = np.maximum(scale, per_segment ** power)
+    return scale